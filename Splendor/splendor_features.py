@@ -0,0 +1,105 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Fixed-layout feature tensors for batches of Splendor states, for learned evaluators
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+
+import numpy as np
+from Splendor.splendor_model import *
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+
+#Per-card features: present, cost (CARD_COLOURS order), colour (one-hot), points, tier (one-hot). Per-noble features:
+#present, cost. Tables have a row for every byte value, such that card and noble IDs read straight out of a state
+#encoding (with EMPTY = 255) index them directly, and empty slots come out as zeros.
+CARD_FEATURE_SIZE  = 1 + 2*len(CARD_COLOURS) + 1 + 3
+NOBLE_FEATURE_SIZE = 1 + len(CARD_COLOURS)
+CARD_FEATURES  = np.zeros((256, CARD_FEATURE_SIZE), dtype=np.float32)
+NOBLE_FEATURES = np.zeros((256, NOBLE_FEATURE_SIZE), dtype=np.float32)
+for _card in CARD_REGISTRY:
+    CARD_FEATURES[_card.id, 0] = 1
+    CARD_FEATURES[_card.id, 1:6] = _card.cost_vector
+    CARD_FEATURES[_card.id, 6+_card.colour_index] = 1
+    CARD_FEATURES[_card.id, 11] = _card.points
+    CARD_FEATURES[_card.id, 12+_card.deck_id] = 1
+for _i,(_,_cost) in enumerate(NOBLES):
+    NOBLE_FEATURES[_i, 0] = 1
+    NOBLE_FEATURES[_i, 1:] = [_cost.get(c, 0) for c in CARD_COLOURS]
+CARD_COLOUR_ONEHOT = CARD_FEATURES[:len(CARDS), 6:11]
+CARD_TIER_ONEHOT   = CARD_FEATURES[:len(CARDS), 12:15]
+
+#Feature layout of one state. Agents are in ID order, padded with zeros to MAX_AGENTS. Each agent block holds: present,
+#gems (GEM_COLOURS order), bonuses (bought cards per colour), score, passed, nobles held, and three reserved card slots.
+AGENT_FEATURE_SIZE = 1 + len(GEM_COLOURS) + len(CARD_COLOURS) + 3 + 3*CARD_FEATURE_SIZE
+FEATURE_LAYOUT = {}
+_offset = 0
+for _name,_size in [('board_gems', len(GEM_COLOURS)), ('dealt', 12*CARD_FEATURE_SIZE), ('nobles', 5*NOBLE_FEATURE_SIZE),
+                    ('deck_lengths', 3), ('to_move', MAX_AGENTS), ('agents', MAX_AGENTS*AGENT_FEATURE_SIZE)]:
+    FEATURE_LAYOUT[_name] = slice(_offset, _offset+_size)
+    _offset += _size
+FEATURE_SIZE = _offset
+
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+
+#Encode a batch of states (SplendorStates, or their to_bytes encodings) as an [N, FEATURE_SIZE] array laid out as per
+#FEATURE_LAYOUT. If out is given, features are written into its first N rows and that view is returned; otherwise an
+#array of the given dtype (float32, or uint8 since every feature fits a byte) is allocated. States are first packed
+#into their fixed binary encoding, one buffer per number of agents, and all features are then gathered from those
+#buffers by table lookups, so the per-state Python work is the encoding alone.
+def encode_states(states, out=None, dtype=np.float32):
+    n = len(states)
+    if out is None:
+        out = np.zeros((n, FEATURE_SIZE), dtype=dtype)
+    else:
+        out = out[:n]
+        out[:] = 0
+    groups = {}
+    for i,state in enumerate(states):
+        num_agents = len(state.agents) if isinstance(state, SplendorState) else state[2]
+        groups.setdefault(num_agents, []).append(i)
+    for num_agents,rows in groups.items():
+        size = state_nbytes(num_agents)
+        buf  = bytearray(size*len(rows))
+        for k,i in enumerate(rows):
+            if isinstance(states[i], SplendorState):
+                states[i].to_bytes(buf, k*size)
+            else:
+                buf[k*size:(k+1)*size] = states[i]
+        encoded = np.frombuffer(buf, dtype=np.uint8).reshape(len(rows), size)
+        out[rows] = encode_buffers(encoded, num_agents)
+    return out
+
+#Features for an [N, state_nbytes(num_agents)] uint8 array of state encodings.
+def encode_buffers(encoded, num_agents):
+    n = len(encoded)
+    features = np.zeros((n, FEATURE_SIZE), dtype=np.float32)
+    dealt  = encoded[:, CODEC_DEALT:CODEC_DEALT+12]
+    agents = encoded[:, CODEC_AGENTS:].reshape(n, num_agents, CODEC_AGENT_SIZE)
+    reserved = agents[:, :, CODEC_RESERVED:CODEC_RESERVED+3]
+    bought = np.unpackbits(agents[:, :, CODEC_BOUGHT:], axis=2, bitorder='little')[:, :, :len(CARDS)].astype(np.float32)
+    #Deck lengths are whatever remains of each tier once dealt, reserved and bought cards are accounted for.
+    placed = CARD_FEATURES[dealt][:, :, 12:15].sum(axis=1) + CARD_FEATURES[reserved][:, :, :, 12:15].sum(axis=(1, 2)) \
+             + (bought @ CARD_TIER_ONEHOT).sum(axis=1)
+    features[:, FEATURE_LAYOUT['board_gems']]   = encoded[:, CODEC_GEMS:CODEC_GEMS+len(GEM_COLOURS)]
+    features[:, FEATURE_LAYOUT['dealt']]        = CARD_FEATURES[dealt].reshape(n, -1)
+    features[:, FEATURE_LAYOUT['nobles']]       = NOBLE_FEATURES[encoded[:, CODEC_NOBLES:CODEC_NOBLES+5]].reshape(n, -1)
+    features[:, FEATURE_LAYOUT['deck_lengths']] = np.array(DECK_SIZES, dtype=np.float32) - placed
+    features[np.arange(n), FEATURE_LAYOUT['to_move'].start + encoded[:, 3]] = 1
+    blocks = np.zeros((n, num_agents, AGENT_FEATURE_SIZE), dtype=np.float32)
+    blocks[:, :, 0]     = 1
+    blocks[:, :, 1:7]   = agents[:, :, CODEC_AGENT_GEMS:CODEC_AGENT_GEMS+len(GEM_COLOURS)]
+    blocks[:, :, 7:12]  = bought @ CARD_COLOUR_ONEHOT
+    blocks[:, :, 12]    = agents[:, :, CODEC_SCORE]
+    blocks[:, :, 13]    = agents[:, :, CODEC_PASSED]
+    blocks[:, :, 14]    = (agents[:, :, CODEC_OWN_NOBLES:CODEC_OWN_NOBLES+5] != EMPTY).sum(axis=2)
+    blocks[:, :, 15:]   = CARD_FEATURES[reserved].reshape(n, num_agents, -1)
+    start = FEATURE_LAYOUT['agents'].start
+    features[:, start:start+num_agents*AGENT_FEATURE_SIZE] = blocks.reshape(n, -1)
+    return features
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
@@ -8,6 +8,8 @@
 
 
 import random, itertools, copy
+import numpy as np
+from types import MappingProxyType
 from Splendor.splendor_utils import *
 from template import GameState, GameRule
 import Splendor.splendor_utils as utils
@@ -15,14 +17,35 @@ import Splendor.splendor_utils as utils
 # CLASS DEF ----------------------------------------------------------------------------------------------------------#       
 
 
+#Dense indices used by the card registry and compact representation. Gems follow the order of COLOURS (yellow included), card colours
+#skip yellow, and cards/nobles are numbered by their position in CARDS/NOBLES.
+GEM_COLOURS  = list(COLOURS.values())
+CARD_COLOURS = [c for c in GEM_COLOURS if c!='yellow']
+GEM_INDEX    = {c:i for i,c in enumerate(GEM_COLOURS)}
+CARD_CODES   = list(CARDS.keys())
+CARD_INDEX   = {code:i for i,code in enumerate(CARD_CODES)}
+NOBLE_INDEX  = {code:i for i,(code,_) in enumerate(NOBLES)}
+DECK_SIZES   = [sum(1 for c in CARDS.values() if c[2]==i+1) for i in range(3)]
+EMPTY        = 0xFF #Marks an empty card or noble slot.
+
+
 #Represents cards with a colour (str), unique code (str), resource costs (dict), deck ID (int), and points (int).
+#Cards are immutable and hashable. One instance per card is interned in CARD_REGISTRY at import, with a dense integer
+#id (its index in CARDS), a cost vector (tuple, in CARD_COLOURS order) and its colour index; states share these
+#instances rather than building fresh ones, and copying or unpickling a card returns the registered instance.
 class Card():
+    __slots__ = ('colour', 'code', 'cost', 'deck_id', 'points', 'id', 'cost_vector', 'colour_index')
+    IMMUTABLE = True #Handed to agents as is, rather than through a read-only view (see state_view.py).
     def __init__(self, colour, code, cost, deck_id, points):
-        self.colour = colour
-        self.code = code        
-        self.cost = cost
-        self.deck_id = deck_id
-        self.points = points
+        for attr,value in [('colour', colour), ('code', code), ('cost', MappingProxyType(dict(cost))),
+                           ('deck_id', deck_id), ('points', points), ('id', CARD_INDEX.get(code)),
+                           ('cost_vector', tuple(cost.get(c, 0) for c in CARD_COLOURS)),
+                           ('colour_index', CARD_COLOURS.index(colour) if colour in CARD_COLOURS else None)]:
+            object.__setattr__(self, attr, value)
+    def __setattr__(self, name, value):
+        raise AttributeError('Cards are immutable')
+    def __delattr__(self, name):
+        raise AttributeError('Cards are immutable')
     def __str__(self):
         gem_string = ''
         for colour,number in self.cost.items():
@@ -31,16 +54,120 @@ class Card():
     def __repr__(self):
         return self.code
     def __eq__(self, other): #Equal in the ways that matter: code is identical, and points haven't been tampered with.
+        if other is self:
+            return self.points==CARDS[self.code][-1]
         return hasattr(other, 'code') and other.code==self.code and self.points==other.points==CARDS[other.code][-1]
+    def __hash__(self):
+        return hash(self.code)
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
+    def __reduce__(self):
+        return (get_card, (self.code,))
+    #Cards pickled before the registry existed carry their attributes as a dict.
+    def __setstate__(self, state):
+        state = state[1] if isinstance(state, tuple) else state
+        Card.__init__(self, state['colour'], state['code'], state['cost'], state['deck_id'], state['points'])
+
+CARD_REGISTRY = [Card(colour, code, cost, deck_id-1, points) for code,(colour, cost, deck_id, points) in CARDS.items()]
+
+def get_card(code):
+    return CARD_REGISTRY[CARD_INDEX[code]]
     
 
+#Zobrist keys for incremental 64-bit state hashing. Keys are drawn from a fixed-seed generator, so hashes are stable
+#across processes, and the global random module is left untouched. A state's hash covers board gems, dealt slots and
+#nobles, and per agent; gems, bought and reserved cards, nobles, score and pass flag, plus the agent to move. Deck
+#order is hidden information and is not hashed. Counts are indexed directly, so each table is sized to a byte.
+_zobrist_rng  = random.Random(90054)
+_zobrist_keys = lambda *shape : [_zobrist_keys(*shape[1:]) for _ in range(shape[0])] if len(shape)>1 \
+                                else [_zobrist_rng.getrandbits(64) for _ in range(shape[0])]
+MAX_AGENTS         = 4
+Z_BOARD_GEMS       = _zobrist_keys(len(GEM_COLOURS), 256)
+Z_DEALT            = _zobrist_keys(12, len(CARDS)+1) #Final entry marks an empty slot.
+Z_BOARD_NOBLES     = _zobrist_keys(len(NOBLES))
+Z_AGENT_GEMS       = _zobrist_keys(MAX_AGENTS, len(GEM_COLOURS), 256)
+Z_AGENT_CARDS      = _zobrist_keys(MAX_AGENTS, len(CARDS))
+Z_AGENT_RESERVED   = _zobrist_keys(MAX_AGENTS, len(CARDS))
+Z_AGENT_NOBLES     = _zobrist_keys(MAX_AGENTS, len(NOBLES))
+Z_AGENT_SCORE      = _zobrist_keys(MAX_AGENTS, 256)
+Z_AGENT_PASSED     = _zobrist_keys(MAX_AGENTS)
+Z_TO_MOVE          = _zobrist_keys(MAX_AGENTS)
+Z_DEALT_CARD       = _zobrist_keys(len(CARDS)) #Slot-independent keys for dealt cards, used by canonical_hash.
+
+def board_zobrist(board):
+    h = 0
+    for i,c in enumerate(GEM_COLOURS):
+        h ^= Z_BOARD_GEMS[i][board.gems[c]]
+    for noble in board.nobles:
+        h ^= Z_BOARD_NOBLES[NOBLE_INDEX[noble[0]]]
+    return h
+
+def dealt_zobrist(board, deck_id):
+    h = 0
+    for j,card in enumerate(board.dealt[deck_id]):
+        h ^= Z_DEALT[deck_id*4+j][card.id if card else len(CARDS)]
+    return h
+
+#Hash of an agent, less its bought cards (which only ever grow, and are hashed in as they are bought).
+def agent_zobrist(agent):
+    a = agent.id
+    h = Z_AGENT_SCORE[a][agent.score] ^ (Z_AGENT_PASSED[a] if agent.passed else 0)
+    for i,c in enumerate(GEM_COLOURS):
+        h ^= Z_AGENT_GEMS[a][i][agent.gems[c]]
+    for card in agent.cards['yellow']:
+        h ^= Z_AGENT_RESERVED[a][card.id]
+    for noble in agent.nobles:
+        h ^= Z_AGENT_NOBLES[a][NOBLE_INDEX[noble[0]]]
+    return h
+
+#Hash of every part of a state that one action by agent_id can change, bar bought cards. This touches a bounded number
+#of keys regardless of game length, so generateSuccessor can update state.zobrist by XORing it out and back in.
+def zobrist_mutable(state, agent_id, deck_id=None):
+    h = Z_TO_MOVE[state.agent_to_move] ^ board_zobrist(state.board) ^ agent_zobrist(state.agents[agent_id])
+    return h if deck_id is None else h ^ dealt_zobrist(state.board, deck_id)
+
+#Full (non-incremental) Zobrist hash of a SplendorState.
+def zobrist_hash(state):
+    h = Z_TO_MOVE[state.agent_to_move] ^ board_zobrist(state.board)
+    for deck_id in range(3):
+        h ^= dealt_zobrist(state.board, deck_id)
+    for agent in state.agents:
+        h ^= agent_zobrist(agent)
+        for colour,cards in agent.cards.items():
+            if colour != 'yellow':
+                for card in cards:
+                    h ^= Z_AGENT_CARDS[agent.id][card.id]
+    return h
+
+
 #Represents game as agents playing on a board with cards, gems, and nobles.
 class SplendorState(GameState):           
-    def __init__(self, num_agents):
-        self.board  =  self.BoardState(num_agents)
+    def __init__(self, num_agents, rng=random):
+        self.board  =  self.BoardState(num_agents, rng)
         self.agents = [self.AgentState(i) for i in range(num_agents)]
         self.agent_to_move = 0
+        self.zobrist = zobrist_hash(self) #Maintained incrementally by SplendorGameRule.generateSuccessor.
     
+    #Fixed-layout binary encoding; see state_to_bytes. Returns bytes, unless written into a given buffer.
+    def to_bytes(self, buf=None, offset=0):
+        return bytes(state_to_bytes(self)) if buf is None else state_to_bytes(self, buf, offset)
+
+    @staticmethod
+    def from_bytes(buf, offset=0):
+        return state_from_bytes(buf, offset)
+
+    #Bound every agent's trace to its most recent limit entries (0 records nothing, None restores unbounded traces).
+    #Useful on states that are copied and simulated from, where full histories aren't needed.
+    def set_trace_limit(self, limit):
+        for agent in self.agents:
+            agent.agent_trace.limit = limit
+            if limit is not None and len(agent.agent_trace) > limit:
+                entries = agent.agent_trace.history.entries()
+                agent.agent_trace.history = TraceNode.build(entries[len(entries)-limit:])
+        return self
+
     # def __repr__(self) -> str:
     #     return super().__repr__()
 
@@ -52,29 +179,34 @@ class SplendorState(GameState):
         return output
     
     class BoardState:
-        def __init__(self, num_agents):
+        def __init__(self, num_agents, rng=random):
             self.decks = [[], [], []]
             self.dealt = [[None]*4 for i in range(3)]
             #All gem stacks start at (4,5,7) for games of (2,3,4) players respectively. Yellow seals always start at 5.
             n = [4,5,7][num_agents-2]
             self.gems = {'black':n, 'red':n, 'yellow':5, 'green':n, 'blue':n, 'white':n}
+            #Seed the board's own generator from rng (the global random module by default), such that games stay
+            #reproducible from a seed, but dealing never consumes rng's stream afterwards (see deal).
+            self.rng = StateRNG(rng.getrandbits(64))
             #Deal out num_agents+1 of the 10 nobles at random. Nobles = (code, cost).
-            self.nobles = random.sample(NOBLES, k=num_agents+1)
-            #Sort cards into three deck tiers. Deal four cards per tier. Decks are shuffled before each deal.
-            for code, (colour, cost, deck_id, points) in CARDS.items():
-                deck_id -= 1 #Deck IDs are read in as (1-3), but should be zero-indexed instead.
-                card = Card(colour, code, cost, deck_id, points)
-                self.decks[deck_id].append(card)
+            self.nobles = rng.sample(NOBLES, k=num_agents+1)
+            #Sort cards into three deck tiers. Deal four cards per tier. Each deal draws a uniformly random card.
+            for card in CARD_REGISTRY:
+                self.decks[card.deck_id].append(card)
             for deck in self.decks:
-                random.shuffle(deck)
+                rng.shuffle(deck)
             for i in range(3):
                 for j in range(4):
                     self.dealt[i][j] = self.deal(i)
                 
+        #Draw a uniformly random card from the given tier in constant time, by swapping it with the last card and
+        #popping. Uses the board's own generator, so simulating deals leaves the global random module untouched.
         def deal(self, deck_id):
-            if len(self.decks[deck_id]):
-                random.shuffle(self.decks[deck_id])
-                return self.decks[deck_id].pop()
+            deck = self.decks[deck_id]
+            if len(deck):
+                i = self.rng.randbelow(len(deck))
+                deck[i],deck[-1] = deck[-1],deck[i]
+                return deck.pop()
             return None
         
         def dealt_list(self):
@@ -117,26 +249,630 @@ class SplendorState(GameState):
             return output
         
 
+#Represents a SplendorState as a single fixed-layout bytearray, such that cloning a state is one buffer copy. Every
+#quantity in Splendor fits in a byte: gem stacks, scores, card IDs (0-89) and noble IDs (0-9). The layout is:
+#  header:   num_agents, agent_to_move, rng[8] (the board generator's state, little-endian)
+#  board:    gems[6], dealt[3x4] (card IDs), nobles[5] (noble IDs, in board order), deck lengths[3], decks[90]
+#  owners:   per card; EMPTY if not bought, else (agent ID << 3 | position in that agent's colour stack)
+#  agents:   per agent; score, passed, gems[6], card counts[5], reserved[3], nobles[5]
+#Empty slots hold EMPTY. Decks are stored tier by tier in list order, such that dealing pops from the end of a tier.
+#Agent traces and last actions are history rather than position, and are not carried by the compact state.
+class SplendorCompactState():
+    NUM_AGENTS, TO_MOVE, RNG = 0, 1, 2
+    BOARD_GEMS   = RNG + 8
+    DEALT        = BOARD_GEMS + 6
+    NOBLES       = DEALT + 12
+    DECK_LENS    = NOBLES + 5
+    DECKS        = DECK_LENS + 3
+    DECK_OFFSETS = [DECKS, DECKS+DECK_SIZES[0], DECKS+DECK_SIZES[0]+DECK_SIZES[1]]
+    OWNERS       = DECKS + len(CARDS)
+    AGENTS       = OWNERS + len(CARDS)
+    #Offsets within each agent's block.
+    SCORE, PASSED, GEMS, CARDS, RESERVED, OWN_NOBLES = 0, 1, 2, 8, 13, 16
+    AGENT_SIZE   = 21
+
+    __slots__ = ('buf',)
+
+    def __init__(self, num_agents, buf=None):
+        if buf is None:
+            buf = bytearray(self.AGENTS + self.AGENT_SIZE*num_agents)
+            buf[self.NUM_AGENTS] = num_agents
+            for start,end in [(self.DEALT, self.DECK_LENS), (self.DECKS, self.AGENTS)]:
+                buf[start:end] = bytes([EMPTY])*(end-start)
+            for a in range(num_agents):
+                base = self.AGENTS + self.AGENT_SIZE*a
+                buf[base+self.RESERVED:base+self.AGENT_SIZE] = bytes([EMPTY])*(self.AGENT_SIZE-self.RESERVED)
+        self.buf = buf
+
+    @property
+    def num_agents(self):
+        return self.buf[self.NUM_AGENTS]
+
+    def agent_base(self, agent_id):
+        return self.AGENTS + self.AGENT_SIZE*agent_id
+
+    def clone(self):
+        return SplendorCompactState(None, bytearray(self.buf))
+
+    def __eq__(self, other):
+        return isinstance(other, SplendorCompactState) and self.buf==other.buf
+
+    def __hash__(self):
+        return hash(bytes(self.buf))
+
+    #Deal a card from the given tier, or return EMPTY if the tier is exhausted. Draws exactly as BoardState.deal does,
+    #advancing the generator held in the header, so both representations deal identically.
+    def deal(self, deck_id):
+        buf,start = self.buf,self.DECK_OFFSETS[deck_id]
+        n = buf[self.DECK_LENS+deck_id]
+        if not n:
+            return EMPTY
+        rng,z = splitmix64(int.from_bytes(buf[self.RNG:self.RNG+8], 'little'))
+        buf[self.RNG:self.RNG+8] = rng.to_bytes(8, 'little')
+        i,last = start + ((z*n) >> 64), start+n-1
+        card_id = buf[i]
+        buf[i],buf[last] = buf[last],EMPTY
+        buf[self.DECK_LENS+deck_id] = n-1
+        return card_id
+
+    @classmethod
+    def from_state(cls, state):
+        board = state.board
+        num_agents = len(state.agents)
+        cs  = cls(num_agents)
+        buf = cs.buf
+        buf[cls.TO_MOVE] = state.agent_to_move
+        buf[cls.RNG:cls.RNG+8] = board.rng.state.to_bytes(8, 'little')
+        for c,n in board.gems.items():
+            buf[cls.BOARD_GEMS+GEM_INDEX[c]] = n
+        for i in range(3):
+            for j in range(4):
+                card = board.dealt[i][j]
+                buf[cls.DEALT+i*4+j] = card.id if card else EMPTY
+            buf[cls.DECK_LENS+i] = len(board.decks[i])
+            for k,card in enumerate(board.decks[i]):
+                buf[cls.DECK_OFFSETS[i]+k] = card.id
+        for k,noble in enumerate(board.nobles):
+            buf[cls.NOBLES+k] = NOBLE_INDEX[noble[0]]
+        for agent in state.agents:
+            base = cs.agent_base(agent.id)
+            buf[base+cls.SCORE]  = agent.score
+            buf[base+cls.PASSED] = agent.passed
+            for c,n in agent.gems.items():
+                buf[base+cls.GEMS+GEM_INDEX[c]] = n
+            for k,c in enumerate(CARD_COLOURS):
+                buf[base+cls.CARDS+k] = len(agent.cards[c])
+                for pos,card in enumerate(agent.cards[c]):
+                    buf[cls.OWNERS+card.id] = agent.id<<3 | pos
+            for k,card in enumerate(agent.cards['yellow']):
+                buf[base+cls.RESERVED+k] = card.id
+            for k,noble in enumerate(agent.nobles):
+                buf[base+cls.OWN_NOBLES+k] = NOBLE_INDEX[noble[0]]
+        return cs
+
+    #Rebuild a full SplendorState, with a board generator continuing from the stored one. The random module is left
+    #untouched, as the board is not dealt afresh. The position round-trips, but not its history: agents come back with
+    #empty traces and no last action.
+    def to_state(self):
+        buf = self.buf
+        num_agents = buf[self.NUM_AGENTS]
+        card  = lambda i : CARD_REGISTRY[i]
+        slots = lambda start,n : [buf[start+k] for k in range(n) if buf[start+k]!=EMPTY]
+        state = SplendorState.__new__(SplendorState)
+        state.agent_to_move = buf[self.TO_MOVE]
+        board = state.board = SplendorState.BoardState.__new__(SplendorState.BoardState)
+        board.rng    = StateRNG(int.from_bytes(buf[self.RNG:self.RNG+8], 'little'))
+        board.gems   = {c:buf[self.BOARD_GEMS+i] for i,c in enumerate(GEM_COLOURS)}
+        board.dealt  = [[card(buf[self.DEALT+i*4+j]) if buf[self.DEALT+i*4+j]!=EMPTY else None for j in range(4)]
+                        for i in range(3)]
+        board.decks  = [[card(i) for i in slots(self.DECK_OFFSETS[d], buf[self.DECK_LENS+d])] for d in range(3)]
+        board.nobles = [NOBLES[i] for i in slots(self.NOBLES, 5)]
+        state.agents = []
+        for a in range(num_agents):
+            base  = self.agent_base(a)
+            agent = SplendorState.AgentState(a)
+            agent.score  = buf[base+self.SCORE]
+            agent.passed = bool(buf[base+self.PASSED])
+            agent.gems   = {c:buf[base+self.GEMS+i] for i,c in enumerate(GEM_COLOURS)}
+            for k,c in enumerate(CARD_COLOURS):
+                agent.cards[c] = [None]*buf[base+self.CARDS+k]
+            agent.cards['yellow'] = [card(i) for i in slots(base+self.RESERVED, 3)]
+            agent.nobles = [NOBLES[i] for i in slots(base+self.OWN_NOBLES, 5)]
+            state.agents.append(agent)
+        for card_id in range(len(CARDS)):
+            owner = buf[self.OWNERS+card_id]
+            if owner!=EMPTY:
+                c = card(card_id)
+                state.agents[owner>>3].cards[c.colour][owner&7] = c
+        state.zobrist = zobrist_hash(state)
+        return state
+
+
+#Resample the hidden part of a state in place, for information-set search: every deck is reshuffled, and the board's
+#generator reseeded, from rng (a random.Random). Visible cards, gems and nobles are untouched, so the Zobrist hash is
+#unchanged. Accepts a SplendorState or SplendorCompactState, and returns it.
+def determinize(state, rng):
+    if isinstance(state, SplendorCompactState):
+        cs,buf = SplendorCompactState,state.buf
+        for deck_id in range(3):
+            start,n = cs.DECK_OFFSETS[deck_id],buf[cs.DECK_LENS+deck_id]
+            deck = list(buf[start:start+n])
+            rng.shuffle(deck)
+            buf[start:start+n] = bytes(deck)
+        buf[cs.RNG:cs.RNG+8] = rng.getrandbits(64).to_bytes(8, 'little')
+        return state
+    for deck in state.board.decks:
+        rng.shuffle(deck)
+    state.board.rng = StateRNG(rng.getrandbits(64))
+    return state
+
+
+#Fixed-layout binary encodings of states and actions, for moving them across process and file boundaries without
+#pickling Card objects. Every encoding opens with a magic byte and CODEC_VERSION. A state is laid out as:
+#  header:   magic, version, num_agents, agent_to_move, rng[8] (little-endian)
+#  board:    gems[6], dealt[3x4] (card IDs), nobles[5] (noble IDs, in board order)
+#  agents:   per agent; score, passed, gems[6], reserved[3], nobles[5], bought cards (90-bit set, little-endian)
+#Empty slots hold EMPTY. That is 91 bytes for two agents. Decks hold whichever cards are neither dealt, reserved nor
+#bought, and are rebuilt in registry order; bought stacks are rebuilt in card ID order. Neither order is part of the
+#position (and the Zobrist hash ignores both), but a decoded state will deal a different sequence of cards than the
+#original. Traces and last actions are history, and are not encoded.
+#An action is laid out as: magic, version, type, collected_gems[6], returned_gems[6], card ID, noble ID (17 bytes).
+#Decoders accept any buffer (bytes, bytearray, memoryview) and an offset, and read fields in place without copying.
+CODEC_VERSION  = 1
+STATE_MAGIC    = ord('S')
+ACTION_MAGIC   = ord('A')
+ACTION_TYPES   = ['collect_diff', 'collect_same', 'reserve', 'buy_available', 'buy_reserve', 'pass']
+ACTION_TYPE_INDEX = {t:i for i,t in enumerate(ACTION_TYPES)}
+ACTION_NBYTES  = 17
+CODEC_RNG, CODEC_GEMS, CODEC_DEALT, CODEC_NOBLES, CODEC_AGENTS = 4, 12, 18, 30, 35
+#Offsets within each agent's block.
+CODEC_SCORE, CODEC_PASSED, CODEC_AGENT_GEMS, CODEC_RESERVED, CODEC_OWN_NOBLES, CODEC_BOUGHT = 0, 1, 2, 8, 11, 16
+CODEC_AGENT_SIZE = CODEC_BOUGHT + (len(CARDS)+7)//8
+
+def state_nbytes(num_agents):
+    return CODEC_AGENTS + CODEC_AGENT_SIZE*num_agents
+
+def check_header(buf, offset, magic):
+    if buf[offset] != magic or buf[offset+1] != CODEC_VERSION:
+        raise ValueError(f'Expected a {chr(magic)!r} encoding of version {CODEC_VERSION}, '
+                         f'got {chr(buf[offset])!r} version {buf[offset+1]}')
+
+#Write state into buf at offset (allocating a buffer if none is given), and return the buffer.
+def state_to_bytes(state, buf=None, offset=0):
+    board,num_agents = state.board,len(state.agents)
+    if buf is None:
+        buf = bytearray(state_nbytes(num_agents))
+    end = offset + state_nbytes(num_agents)
+    buf[offset:end] = bytes([EMPTY])*(end-offset)
+    buf[offset:offset+4] = bytes([STATE_MAGIC, CODEC_VERSION, num_agents, state.agent_to_move])
+    buf[offset+CODEC_RNG:offset+CODEC_RNG+8] = board.rng.state.to_bytes(8, 'little')
+    buf[offset+CODEC_GEMS:offset+CODEC_GEMS+6] = bytes([board.gems[c] for c in GEM_COLOURS])
+    buf[offset+CODEC_DEALT:offset+CODEC_DEALT+12] = bytes([card.id if card else EMPTY for deck in board.dealt for card in deck])
+    for k,noble in enumerate(board.nobles):
+        buf[offset+CODEC_NOBLES+k] = NOBLE_INDEX[noble[0]]
+    for agent in state.agents:
+        base = offset + CODEC_AGENTS + CODEC_AGENT_SIZE*agent.id
+        buf[base+CODEC_SCORE]  = agent.score
+        buf[base+CODEC_PASSED] = agent.passed
+        buf[base+CODEC_AGENT_GEMS:base+CODEC_AGENT_GEMS+6] = bytes([agent.gems[c] for c in GEM_COLOURS])
+        for k,card in enumerate(agent.cards['yellow']):
+            buf[base+CODEC_RESERVED+k] = card.id
+        for k,noble in enumerate(agent.nobles):
+            buf[base+CODEC_OWN_NOBLES+k] = NOBLE_INDEX[noble[0]]
+        bought = 0
+        for c in CARD_COLOURS:
+            for card in agent.cards[c]:
+                bought |= 1 << card.id
+        buf[base+CODEC_BOUGHT:base+CODEC_AGENT_SIZE] = bought.to_bytes(CODEC_AGENT_SIZE-CODEC_BOUGHT, 'little')
+    return buf
+
+def state_from_bytes(buf, offset=0):
+    buf = memoryview(buf)
+    check_header(buf, offset, STATE_MAGIC)
+    num_agents = buf[offset+2]
+    slots = lambda start,n : [buf[start+k] for k in range(n) if buf[start+k]!=EMPTY]
+    state = SplendorState.__new__(SplendorState)
+    state.agent_to_move = buf[offset+3]
+    board = state.board = SplendorState.BoardState.__new__(SplendorState.BoardState)
+    board.rng    = StateRNG(int.from_bytes(buf[offset+CODEC_RNG:offset+CODEC_RNG+8], 'little'))
+    board.gems   = {c:buf[offset+CODEC_GEMS+i] for i,c in enumerate(GEM_COLOURS)}
+    board.dealt  = [[CARD_REGISTRY[buf[offset+CODEC_DEALT+i*4+j]] if buf[offset+CODEC_DEALT+i*4+j]!=EMPTY else None
+                     for j in range(4)] for i in range(3)]
+    board.nobles = [NOBLES[i] for i in slots(offset+CODEC_NOBLES, 5)]
+    placed = set(slots(offset+CODEC_DEALT, 12))
+    state.agents = []
+    for a in range(num_agents):
+        base  = offset + CODEC_AGENTS + CODEC_AGENT_SIZE*a
+        agent = SplendorState.AgentState(a)
+        agent.score  = buf[base+CODEC_SCORE]
+        agent.passed = bool(buf[base+CODEC_PASSED])
+        agent.gems   = {c:buf[base+CODEC_AGENT_GEMS+i] for i,c in enumerate(GEM_COLOURS)}
+        agent.cards['yellow'] = [CARD_REGISTRY[i] for i in slots(base+CODEC_RESERVED, 3)]
+        agent.nobles = [NOBLES[i] for i in slots(base+CODEC_OWN_NOBLES, 5)]
+        bought = int.from_bytes(buf[base+CODEC_BOUGHT:base+CODEC_AGENT_SIZE], 'little')
+        for card in CARD_REGISTRY:
+            if bought >> card.id & 1:
+                agent.cards[card.colour].append(card)
+                placed.add(card.id)
+        placed.update(card.id for card in agent.cards['yellow'])
+        state.agents.append(agent)
+    board.decks = [[card for card in CARD_REGISTRY if card.deck_id==d and card.id not in placed] for d in range(3)]
+    state.zobrist = zobrist_hash(state)
+    return state
+
+#Write action into buf at offset (allocating a buffer if none is given), and return the buffer.
+def action_to_bytes(action, buf=None, offset=0):
+    if buf is None:
+        buf = bytearray(ACTION_NBYTES)
+    collected,returned = action.get('collected_gems', {}),action.get('returned_gems', {})
+    buf[offset:offset+ACTION_NBYTES] = bytes([ACTION_MAGIC, CODEC_VERSION, ACTION_TYPE_INDEX[action['type']]]
+                                             + [collected.get(c, 0) for c in GEM_COLOURS]
+                                             + [returned.get(c, 0) for c in GEM_COLOURS]
+                                             + [action['card'].id if 'card' in action else EMPTY,
+                                                NOBLE_INDEX[action['noble'][0]] if action['noble'] else EMPTY])
+    return buf
+
+#Rebuild an action dict, equal to the one generated by getLegalActions.
+def action_from_bytes(buf, offset=0):
+    buf = memoryview(buf)
+    check_header(buf, offset, ACTION_MAGIC)
+    kind  = ACTION_TYPES[buf[offset+2]]
+    gems  = lambda start : {c:buf[start+i] for i,c in enumerate(GEM_COLOURS) if buf[start+i]}
+    noble = buf[offset+16]
+    noble = NOBLES[noble] if noble!=EMPTY else None
+    if kind == 'pass':
+        return {'type': kind, 'noble': noble}
+    if 'buy' in kind:
+        return {'type': kind, 'card': CARD_REGISTRY[buf[offset+15]], 'returned_gems': gems(offset+9), 'noble': noble}
+    action = {'type': kind, 'collected_gems': gems(offset+3), 'returned_gems': gems(offset+9), 'noble': noble}
+    if kind == 'reserve':
+        action['card'] = CARD_REGISTRY[buf[offset+15]]
+    return action
+
+
+#A gem-count dict that can't be modified, such that one instance can be shared by every action that holds it. Copies
+#(copy, deepcopy, pickling) are ordinary dicts.
+class FrozenGems(dict):
+    IMMUTABLE = True #Handed to agents as is, rather than through a read-only view (see state_view.py).
+    __slots__ = ()
+
+    def _frozen(self, *args, **kwargs):
+        raise TypeError('returned_gems shared between legal actions cannot be modified; copy it first')
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _frozen
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+NO_GEMS = FrozenGems()
+
+#Table of gem-return combinations, keyed on (held gems, collected gems) as count tuples in GEM_COLOURS order. Each
+#entry is built once, on first use, by a multiset enumerator, and thereafter shared by every caller: a lookup is a single
+#dict hit. Entries are tuples of FrozenGems, so an action's returned_gems can't be used to write to the table.
+RETURN_COMBOS = {}
+
+def build_return_combos(held, collected):
+    num_return = sum(held) + sum(collected) - 10
+    if num_return <= 0:
+        return (NO_GEMS,) #If no gems need to be returned, return a single empty combo.
+    #Gem colours just collected may not be returned.
+    returnable = [(GEM_COLOURS[i], 0 if collected[i] else held[i]+collected[i]) for i in range(len(GEM_COLOURS))]
+    combos = []
+    def enumerate_combos(i, remaining, combo):
+        if not remaining:
+            combos.append(FrozenGems(combo))
+            return
+        if i == len(returnable):
+            return
+        colour,count = returnable[i]
+        for n in range(min(count, remaining), -1, -1):
+            enumerate_combos(i+1, remaining-n, combo+[(colour,n)] if n else combo)
+    enumerate_combos(0, num_return, [])
+    return tuple(combos)
+
+#Finite action vocabulary. Every action is identified by a stable integer:
+#    action_id = (main*NUM_RETURNS + returned)*NUM_NOBLE_CHOICES + noble
+#where main indexes ACTION_MAINS (collect colours, or the board/reserved slot a card is reserved or bought from),
+#returned indexes RETURN_VOCAB (gems returned, as count tuples in GEM_COLOURS order), and noble is 0 for no noble, or
+#1 + the noble's position in board.nobles. Buy actions always use returned index 0, as their payment is implied by the
+#state. IDs address slots rather than cards, so they are only meaningful relative to the state they were generated for.
+ACTION_MAINS = [('collect_diff', combo) for k in (1,2,3) for combo in itertools.combinations(CARD_COLOURS, k)] \
+             + [('collect_same', colour) for colour in CARD_COLOURS] \
+             + [('reserve', slot) for slot in range(12)] \
+             + [('buy_available', slot) for slot in range(12)] \
+             + [('buy_reserve', slot) for slot in range(3)] \
+             + [('pass', None)]
+MAIN_INDEX   = {main:i for i,main in enumerate(ACTION_MAINS)}
+RETURN_VOCAB = [counts for k in range(4) for counts in sorted(
+                {tuple(combo.count(c) for c in GEM_COLOURS) for combo in itertools.combinations_with_replacement(GEM_COLOURS, k)},
+                reverse=True)]
+RETURN_INDEX = {counts:i for i,counts in enumerate(RETURN_VOCAB)}
+NUM_RETURNS  = len(RETURN_VOCAB)
+NUM_NOBLE_CHOICES = 6
+NUM_ACTIONS  = len(ACTION_MAINS)*NUM_RETURNS*NUM_NOBLE_CHOICES
+
+#Per-card and per-noble vectors (in CARD_COLOURS order) used by ID-based move generation on compact states.
+CARD_COSTS   = [card.cost_vector for card in CARD_REGISTRY]
+CARD_COLOUR  = [card.colour_index for card in CARD_REGISTRY]
+CARD_TIER    = [card.deck_id for card in CARD_REGISTRY]
+CARD_POINTS  = [card.points for card in CARD_REGISTRY]
+NOBLE_COSTS  = [tuple(cost.get(c, 0) for c in CARD_COLOURS) for _,cost in NOBLES]
+#Positions of the coloured gems within GEM_COLOURS, i.e. the mapping from CARD_COLOURS indices to GEM_COLOURS indices.
+CARD_GEM     = [GEM_INDEX[c] for c in CARD_COLOURS]
+YELLOW       = GEM_INDEX['yellow']
+
+#Cost matrices (cards x colours, nobles x colours) for the vectorised purchase kernel below.
+CARD_COST_MATRIX  = np.array(CARD_COSTS, dtype=np.int16)
+NOBLE_COST_MATRIX = np.array(NOBLE_COSTS, dtype=np.int16)
+
+#Vectorised affordability and noble-eligibility check of a list of cards for one agent. The agent is reduced to card and
+#gem vectors, and every card is tested against the cost matrix at once, paying as resources_sufficient does: cards are
+#spent first, then coloured gems, then wilds. Returns three arrays:
+#  affordable: bool[cards]              whether each card can be bought
+#  payments:   int[cards, GEM_COLOURS]  gems returned to the board for each card (meaningless where unaffordable)
+#  visits:     bool[cards, nobles]      whether each noble would be eligible to visit after buying each card
+def purchase_kernel(agent, cards, nobles):
+    bonuses = np.array([len(agent.cards[c]) for c in CARD_COLOURS], dtype=np.int16)
+    gems    = np.array([agent.gems[c] for c in GEM_COLOURS], dtype=np.int16)
+    ids     = [card.id for card in cards]
+    gem_cost  = np.maximum(CARD_COST_MATRIX[ids] - bonuses, 0)
+    shortfall = np.maximum(gem_cost - gems[CARD_GEM], 0)
+    wilds     = shortfall.sum(axis=1)
+    payments  = np.zeros((len(ids), len(GEM_COLOURS)), dtype=np.int16)
+    payments[:, CARD_GEM] = gem_cost - shortfall
+    payments[:, YELLOW]   = wilds
+    post_bonuses = bonuses + np.eye(len(CARD_COLOURS), dtype=np.int16)[[CARD_COLOUR[i] for i in ids]]
+    noble_costs  = NOBLE_COST_MATRIX[[NOBLE_INDEX[noble[0]] for noble in nobles]]
+    visits = (post_bonuses[:, None, :] >= noble_costs[None, :, :]).all(axis=2)
+    return wilds <= gems[YELLOW], payments, visits
+
+def action_id(main, returned=0, noble=0):
+    return (main*NUM_RETURNS + returned)*NUM_NOBLE_CHOICES + noble
+
+def split_action_id(action_id):
+    rest,noble = divmod(action_id, NUM_NOBLE_CHOICES)
+    main,returned = divmod(rest, NUM_RETURNS)
+    return main, returned, noble
+
+#Return-combo indices into RETURN_VOCAB, mirroring RETURN_COMBOS entry for entry.
+RETURN_COMBO_IDS = {}
+
+def return_combo_ids(held, collected):
+    ids = RETURN_COMBO_IDS.get((held, collected))
+    if ids is None:
+        combos = RETURN_COMBOS.get((held, collected))
+        if combos is None:
+            combos = RETURN_COMBOS[(held, collected)] = build_return_combos(held, collected)
+        ids = RETURN_COMBO_IDS[(held, collected)] = tuple(
+            RETURN_INDEX[tuple(combo.get(c, 0) for c in GEM_COLOURS)] for combo in combos)
+    return ids
+
+#Per-card (colour index, cost, gem index) of each colour the card costs, skipping the colours it doesn't.
+CARD_COST_TERMS = [tuple((k, cost, CARD_GEM[k]) for k,cost in enumerate(costs) if cost) for costs in CARD_COSTS]
+
+#Main action indices and collected gem counts (in GEM_COLOURS order) of collecting each combination of colour indices,
+#and the first main action index of each kind that is followed by one main action per slot.
+COLLECT_DIFF_MAINS = {combo: (MAIN_INDEX[('collect_diff', tuple(CARD_COLOURS[k] for k in combo))],
+                              tuple(int(i in [CARD_GEM[k] for k in combo]) for i in range(len(GEM_COLOURS))))
+                      for n in (1,2,3) for combo in itertools.combinations(range(len(CARD_COLOURS)), n)}
+COLLECT_SAME_MAINS = [(MAIN_INDEX[('collect_same', colour)],
+                       tuple(2*(i==CARD_GEM[k]) for i in range(len(GEM_COLOURS))))
+                      for k,colour in enumerate(CARD_COLOURS)]
+RESERVE_MAIN, BUY_AVAILABLE_MAIN, BUY_RESERVE_MAIN = (MAIN_INDEX[(kind, 0)] for kind in
+                                                      ('reserve', 'buy_available', 'buy_reserve'))
+PASS_MAIN = MAIN_INDEX[('pass', None)]
+
+#Gems (as a count tuple in GEM_COLOURS order) that the agent at buf[base:] would pay for a card, or None if the card
+#is unaffordable. Follows SplendorGameRule.resources_sufficient: cards are spent first, then coloured gems, then wilds.
+def compact_payment(buf, base, card_id):
+    cs = SplendorCompactState
+    wild = buf[base+cs.GEMS+YELLOW]
+    paid = [0]*len(GEM_COLOURS)
+    for k,cost,gem in CARD_COST_TERMS[card_id]:
+        gem_cost  = max(cost - buf[base+cs.CARDS+k], 0)
+        shortfall = max(gem_cost - buf[base+cs.GEMS+gem], 0)
+        wild -= shortfall
+        if wild < 0:
+            return None
+        paid[gem] = gem_cost - shortfall
+        paid[YELLOW] += shortfall
+    return tuple(paid)
+
+
+#Colour symmetry. A permutation of the five card colours (yellow is fixed) that maps every card onto another card, and
+#every noble onto another noble, maps any position onto an equivalent one, since the rules treat colours alike. Such
+#automorphisms are found at import from CARDS and NOBLES. Each is held as (gem index map over GEM_COLOURS, card ID
+#map and noble ID map, both over byte values such that EMPTY maps to itself). The standard card set breaks every
+#colour symmetry, so only the identity is found and colour canonicalization costs nothing; the machinery takes
+#effect for card sets that are colour-symmetric. Canonical forms also ignore how a position happens to be laid out:
+#which slot of its tier a dealt card sits in, and the order of nobles and reserved cards.
+def find_colour_automorphisms():
+    signature = lambda colour,costs,tier,points : (colour, tuple(costs), tier, points)
+    card_ids  = {signature(c.colour_index, c.cost_vector, c.deck_id, c.points):c.id for c in CARD_REGISTRY}
+    noble_ids = {tuple(cost.get(c, 0) for c in CARD_COLOURS):i for i,(_,cost) in enumerate(NOBLES)}
+    found = []
+    for perm in itertools.permutations(range(len(CARD_COLOURS))):
+        permute = lambda costs : tuple(costs[perm.index(k)] for k in range(len(CARD_COLOURS)))
+        card_map  = [card_ids.get(signature(perm[c.colour_index], permute(c.cost_vector), c.deck_id, c.points))
+                     for c in CARD_REGISTRY]
+        noble_map = [noble_ids.get(permute(cost)) for cost in noble_ids]
+        if None in card_map or None in noble_map:
+            continue
+        gem_map = list(range(len(GEM_COLOURS)))
+        for k,gem in enumerate(CARD_GEM):
+            gem_map[gem] = CARD_GEM[perm[k]]
+        pad = lambda ids : ids + list(range(len(ids), 256))
+        found.append((gem_map, pad(card_map), pad(noble_map)))
+    return found
+
+COLOUR_AUTOMORPHISMS = find_colour_automorphisms()
+
+#Apply an automorphism to a state encoding (see state_to_bytes), and lay the result out canonically: dealt cards sorted
+#within each tier, nobles and reserved cards sorted, and the generator state (hidden) zeroed.
+def canonical_encoding(encoded, automorphism):
+    gem_map,card_map,noble_map = automorphism
+    out = bytearray(encoded)
+    out[CODEC_RNG:CODEC_RNG+8] = bytes(8)
+    def remap(start, n, id_map, sort=True):
+        ids = [id_map[i] for i in encoded[start:start+n]]
+        out[start:start+n] = bytes(sorted(ids) if sort else ids)
+    def regem(start):
+        for i in range(len(GEM_COLOURS)):
+            out[start+gem_map[i]] = encoded[start+i]
+    regem(CODEC_GEMS)
+    for tier in range(3):
+        remap(CODEC_DEALT+tier*4, 4, card_map)
+    remap(CODEC_NOBLES, 5, noble_map)
+    for a in range(encoded[2]):
+        base = CODEC_AGENTS + CODEC_AGENT_SIZE*a
+        regem(base+CODEC_AGENT_GEMS)
+        remap(base+CODEC_RESERVED, 3, card_map)
+        remap(base+CODEC_OWN_NOBLES, 5, noble_map)
+        bought = int.from_bytes(encoded[base+CODEC_BOUGHT:base+CODEC_AGENT_SIZE], 'little')
+        bought = sum(1 << card_map[i] for i in range(len(CARDS)) if bought >> i & 1)
+        out[base+CODEC_BOUGHT:base+CODEC_AGENT_SIZE] = bought.to_bytes(CODEC_AGENT_SIZE-CODEC_BOUGHT, 'little')
+    return bytes(out)
+
+#Canonical key (bytes) of a state: equal for any two states that are the same position up to colour symmetry and layout.
+#Deck order and the board generator are hidden, and are ignored, as by the Zobrist hash.
+def canonical_key(state):
+    encoded = state.to_bytes()
+    return min(canonical_encoding(encoded, automorphism) for automorphism in COLOUR_AUTOMORPHISMS)
+
+#Canonical 64-bit hash of a state, for transposition tables. With the standard card set this is state.zobrist with dealt
+#cards keyed by card rather than by slot, computed in a dozen XORs; otherwise it hashes canonical_key.
+def canonical_hash(state):
+    if len(COLOUR_AUTOMORPHISMS) > 1:
+        return hash(canonical_key(state))
+    h = state.zobrist
+    for tier,deck in enumerate(state.board.dealt):
+        for j,card in enumerate(deck):
+            h ^= Z_DEALT[tier*4+j][card.id if card else len(CARDS)] ^ (Z_DEALT_CARD[card.id] if card else 0)
+    return h
+
+#Reduce a list of actions available in state to one representative per equivalence class: actions that an automorphism
+#fixing the state maps onto one another lead to equivalent positions. Order is otherwise preserved. With the standard
+#card set there are no such automorphisms, and the list is returned as is.
+def canonical_actions(state, actions):
+    if len(COLOUR_AUTOMORPHISMS) == 1:
+        return list(actions)
+    encoded = state.to_bytes()
+    key = canonical_encoding(encoded, COLOUR_AUTOMORPHISMS[0])
+    stabilizer = [m for m in COLOUR_AUTOMORPHISMS if canonical_encoding(encoded, m)==key]
+    def action_key(action, automorphism):
+        gem_map,card_map,noble_map = automorphism
+        a = action_to_bytes(action)
+        gems = lambda start : bytes(a[start+gem_map.index(i)] for i in range(len(GEM_COLOURS)))
+        return bytes(a[:3]) + gems(3) + gems(9) + bytes([card_map[a[15]], noble_map[a[16]]])
+    seen,kept = set(),[]
+    for action in actions:
+        k = min(action_key(action, m) for m in stabilizer)
+        if k not in seen:
+            seen.add(k)
+            kept.append(action)
+    return kept
+
+
+#(score, bought cards, passed) per agent, for either state representation.
+def agent_summaries(state):
+    if isinstance(state, SplendorCompactState):
+        cs,buf = SplendorCompactState,state.buf
+        bases = [state.agent_base(a) for a in range(buf[cs.NUM_AGENTS])]
+        return [(buf[b+cs.SCORE], sum(buf[b+cs.CARDS:b+cs.CARDS+len(CARD_COLOURS)]), bool(buf[b+cs.PASSED]))
+                for b in bases]
+    return [(a.score, sum(len(a.cards[c]) for c in CARD_COLOURS), a.passed) for a in state.agents]
+
+#State-level terminal test, needing no GameRule instance. Agent 0 always opens a round, so a state whose agent to move
+#is 0 sits on a round boundary: the game is over there if any agent has at least 15 points. It is also over if every
+#agent has passed. Matches SplendorGameRule.gameEnds for the game's current state.
+def is_terminal(state):
+    summaries = agent_summaries(state)
+    if all(passed for _,_,passed in summaries):
+        return True
+    to_move = state.buf[SplendorCompactState.TO_MOVE] if isinstance(state, SplendorCompactState) else state.agent_to_move
+    return to_move==0 and any(score>=15 for score,_,_ in summaries)
+
+#Final scores for every agent, as SplendorGameRule.calScore reports them: tied victors with the fewest bought cards
+#(among all agents) gain half a point.
+def scores(state):
+    summaries = agent_summaries(state)
+    max_score = max(score for score,_,_ in summaries)
+    min_cards = min(cards for _,cards,_ in summaries)
+    tied = sum(1 for score,_,_ in summaries if score==max_score) > 1
+    return [score + .5 if tied and score==max_score and cards==min_cards else score for score,cards,_ in summaries]
+
+
+#Legal action lists keyed by (Zobrist hash, agent ID). See SplendorGameRule.getLegalActions.
+LEGAL_ACTION_CACHE = LRUCache(1<<12)
+
+
 #Implements game logic.
+#In simulation mode, generateSuccessor skips trace bookkeeping altogether; last actions are still recorded.
+#With action_cache=True, getLegalActions is memoized in LEGAL_ACTION_CACHE, which is shared by every rule in the process
+#(including the engine's, which offers it the lists handed to agents). An LRUCache may be passed to use a private one.
+#With incremental=True, legal actions are maintained by a LegalActionGenerator, suiting long rollouts.
 class SplendorGameRule(GameRule):
-    def __init__(self,num_of_agent):
-        super().__init__(num_of_agent)
+    instrumented_calls = ('generateLegalActions', 'generate_return_combos', 'buy_actions', 'generateSuccessor')
+
+    def __init__(self,num_of_agent,simulation=False,action_cache=False,incremental=False,rng=None):
+        super().__init__(num_of_agent, rng)
+        self.simulation = simulation
+        self.action_cache = LEGAL_ACTION_CACHE if action_cache is True else None if action_cache is False else action_cache
+        self.move_generator = LegalActionGenerator(self) if incremental else None
         #No private information: agent states are available to other agents. While upcoming cards are random, the decks
-        #are still provided in the gamestate for agents to use if they want, since they are shuffled before each deal.
+        #are still provided in the gamestate for agents to use if they want, since each deal draws a random card.
         self.private_information = None
 
+    #Reseed the board's generator from the rule's rng (which Game.Run reseeds from its seed list before every update),
+    #such that the engine's deals are reproducible from the game seed, yet cannot be predicted by agents simulating on
+    #their copy of the state.
+    def update(self, action):
+        self.current_game_state.board.rng.seed((self.rng or random).getrandbits(64))
+        super().update(action)
+
     # # for now the idea is to see whether the action is one of the legal action   
     # def validAction(self, selected, all_legal_actions):
     #     # return utils.ValidAction(m, actions)
         
 
     def initialGameState(self):
-        return SplendorState(self.num_of_agent)
+        return SplendorState(self.num_of_agent, self.rng or random)
+
+    #Snapshot in the binary state encoding: the agent to move (1 byte) and the action count (4 bytes, little-endian),
+    #the state (see state_to_bytes, which holds the board generator's state), then each deck's length and card IDs in
+    #order, which the state encoding leaves out but later deals depend on. About 190 bytes for two agents. As in the
+    #state encoding, traces and last actions are not kept, and bought stacks are restored in card ID order.
+    def snapshotState(self):
+        state = self.current_game_state
+        data = bytearray([self.current_agent_index]) + self.action_counter.to_bytes(4, 'little')
+        data += state_to_bytes(state)
+        for deck in state.board.decks:
+            data += bytes([len(deck)] + [card.id for card in deck])
+        return bytes(data)
+
+    def restoreState(self, data):
+        self.current_agent_index = data[0]
+        self.action_counter = int.from_bytes(data[1:5], 'little')
+        state = state_from_bytes(data, 5)
+        offset = 5 + state_nbytes(len(state.agents))
+        for deck_id in range(3):
+            n = data[offset]
+            state.board.decks[deck_id] = [CARD_REGISTRY[i] for i in data[offset+1:offset+1+n]]
+            offset += 1 + n
+        self.current_game_state = state
+        return self
     
     def generateSuccessor(self, state, action, agent_id):
         agent,board = state.agents[agent_id],state.board
         agent.last_action = action #Record last action such that other agents can make use of this information.
         score = 0
+        deck_id = action['card'].deck_id if 'card' in action else None
+        zobrist = state.zobrist ^ zobrist_mutable(state, agent_id, deck_id) #Hash out the parts this action can change.
         
         if 'card' in action:
             card = action['card']
@@ -152,7 +888,7 @@ class SplendorGameRule(GameRule):
                 board.gems[colour] += count 
             
             if action['type'] == 'reserve':
-                #Remove card from dealt cards by locating via unique code (cards aren't otherwise hashable).
+                #Remove card from dealt cards by locating via unique code (cards arriving from agents may be copies).
                 #Since we want to retain the positioning of dealt cards, set removed card slot to new dealt card.
                 #Since the board may have None cards (empty slots that cannot be filled), check cards first.
                 #Add card to player's yellow stack.
@@ -183,10 +919,11 @@ class SplendorGameRule(GameRule):
             
             #Add card to player's stack of matching colour, and increment agent's score accordingly.
             agent.cards[card.colour].append(card)
+            zobrist ^= Z_AGENT_CARDS[agent_id][card.id]
             score += card.points
             
         if action['noble']:
-            #Remove noble from board. Add noble to player's stack. Like cards, nobles aren't hashable due to possessing
+            #Remove noble from board. Add noble to player's stack. Nobles aren't hashable due to possessing
             #dictionaries (i.e. resource costs). Therefore, locate and delete the noble via unique code.
             #Add noble's points to agent score.
             for i in range(len(board.nobles)):
@@ -197,13 +934,313 @@ class SplendorGameRule(GameRule):
                     break
                 
         #Log this turn's action and any resultant score. Return updated gamestate.
-        agent.agent_trace.action_reward.append((action,score))
+        if not self.simulation:
+            agent.agent_trace.append((action,score))
         agent.score += score
         agent.passed = action['type']=='pass'
+        #Pass the turn, and hash the changed parts back in.
+        state.agent_to_move = (agent_id + 1) % len(state.agents)
+        state.zobrist = zobrist ^ zobrist_mutable(state, agent_id, deck_id)
+        return state
+
+    #Make/unmake interface for depth-first search. apply() performs generateSuccessor in place and returns an undo
+    #token; undo(state, token) restores the state exactly, including the deck and generator used by any deal, so searches
+    #may walk a single shared state down and back up without copying it. Tokens must be undone in LIFO order.
+    #Only the parts of the state that the action can touch are recorded: gem stacks, the affected card tier and deck,
+    #the reserved stack, the noble lists, the agent's score, pass flag, last action and trace, and the agent to move
+    #and Zobrist hash.
+    def apply(self, state, action, agent_id):
+        agent,board = state.agents[agent_id],state.board
+        tier = None
+        if 'card' in action:
+            tier = action['card'].deck_id
+            tier = (tier, board.dealt[tier][:], board.decks[tier][:], board.rng.state)
+        token = (agent_id, tier, dict(board.gems), dict(agent.gems), agent.cards['yellow'][:],
+                 board.nobles[:], len(agent.nobles), agent.score, agent.passed, agent.last_action,
+                 agent.agent_trace.history, action, state.agent_to_move, state.zobrist)
+        self.generateSuccessor(state, action, agent_id)
+        return token
+
+    def undo(self, state, token):
+        agent_id,tier,board_gems,agent_gems,reserved,nobles,num_nobles,score,passed,last_action,history,action, \
+            agent_to_move,zobrist = token
+        agent,board = state.agents[agent_id],state.board
+        if tier is not None:
+            deck_id,dealt,deck,rng = tier
+            board.dealt[deck_id][:] = dealt
+            board.decks[deck_id][:] = deck
+            board.rng.state = rng
+        if 'buy' in action['type']:
+            agent.cards[action['card'].colour].pop()
+        board.gems.update(board_gems)
+        agent.gems.update(agent_gems)
+        agent.cards['yellow'][:] = reserved
+        board.nobles[:] = nobles
+        del agent.nobles[num_nobles:]
+        agent.agent_trace.history = history
+        agent.score,agent.passed,agent.last_action = score,passed,last_action
+        state.agent_to_move,state.zobrist = agent_to_move,zobrist
         return state
 
+    #Compact counterpart of generateSuccessor. Applies the same transitions (and draws identically from the stored
+    #generator when dealing) to a SplendorCompactState in place, without allocating Card objects or copying nested dicts.
+    #Integer action IDs are also accepted, and are applied via apply_action_id.
+    def generateCompactSuccessor(self, cstate, action, agent_id):
+        if type(action) is int:
+            return self.apply_action_id(cstate, action, agent_id)
+        cs,buf = SplendorCompactState,cstate.buf
+        base = cstate.agent_base(agent_id)
+        score = 0
+        
+        if 'card' in action:
+            card = action['card']
+            card_id = card.id
+        
+        if 'collect' in action['type'] or action['type']=='reserve':
+            for colour,count in action['collected_gems'].items():
+                buf[cs.BOARD_GEMS+GEM_INDEX[colour]] -= count
+                buf[base+cs.GEMS+GEM_INDEX[colour]] += count
+            for colour,count in action['returned_gems'].items():
+                buf[base+cs.GEMS+GEM_INDEX[colour]] -= count
+                buf[cs.BOARD_GEMS+GEM_INDEX[colour]] += count
+            
+            if action['type'] == 'reserve':
+                slot = self.find_slot(buf, cs.DEALT+card.deck_id*4, 4, card_id)
+                if slot is not None:
+                    buf[slot] = cstate.deal(card.deck_id)
+                    buf[self.find_slot(buf, base+cs.RESERVED, 3, EMPTY)] = card_id
+        
+        elif 'buy' in action['type']:
+            for colour,count in action['returned_gems'].items():
+                buf[base+cs.GEMS+GEM_INDEX[colour]] -= count
+                buf[cs.BOARD_GEMS+GEM_INDEX[colour]] += count
+            if 'available' in action['type']:
+                slot = self.find_slot(buf, cs.DEALT+card.deck_id*4, 4, card_id)
+                if slot is not None:
+                    buf[slot] = cstate.deal(card.deck_id)
+            else:
+                self.remove_slot(buf, base+cs.RESERVED, 3, card_id)
+            
+            stack = base+cs.CARDS+CARD_COLOURS.index(card.colour)
+            buf[cs.OWNERS+card_id] = agent_id<<3 | buf[stack]
+            buf[stack] += 1
+            score += card.points
+            
+        if action['noble']:
+            noble_id = NOBLE_INDEX[action['noble'][0]]
+            if self.remove_slot(buf, cs.NOBLES, 5, noble_id):
+                buf[self.find_slot(buf, base+cs.OWN_NOBLES, 5, EMPTY)] = noble_id
+                score += 3
+                
+        buf[base+cs.SCORE] += score
+        buf[base+cs.PASSED] = action['type']=='pass'
+        buf[cs.TO_MOVE] = (agent_id + 1) % buf[cs.NUM_AGENTS]
+        return cstate
+
+    #Return the buffer index of the first of n slots holding value, or None if absent.
+    def find_slot(self, buf, start, n, value):
+        for i in range(start, start+n):
+            if buf[i]==value:
+                return i
+        return None
+
+    #Delete value from a run of n slots, shifting later entries down to preserve their order. Returns success.
+    def remove_slot(self, buf, start, n, value):
+        i = self.find_slot(buf, start, n, value)
+        if i is None:
+            return False
+        buf[i:start+n-1] = buf[i+1:start+n]
+        buf[start+n-1] = EMPTY
+        return True
+
+    #Integer action IDs (see ACTION_MAINS). legal_action_ids returns the IDs of every legal action, in the same order
+    #that getLegalActions lists them, for either a SplendorState or a SplendorCompactState. As it runs once per ply of
+    #a compact rollout, it works from the per-card and per-colour tables above, rather than from action tuples.
+    def legal_action_ids(self, state, agent_id):
+        cstate = state if isinstance(state, SplendorCompactState) else SplendorCompactState.from_state(state)
+        cs,buf = SplendorCompactState,cstate.buf
+        base  = cstate.agent_base(agent_id)
+        cards = buf[base+cs.CARDS:base+cs.CARDS+len(CARD_COLOURS)]
+        held  = tuple(buf[base+cs.GEMS:base+cs.GEMS+len(GEM_COLOURS)])
+        board_gems = buf[cs.BOARD_GEMS:cs.BOARD_GEMS+len(GEM_COLOURS)]
+        
+        #How many cards each noble on the board is still owed, and the colour index of the last one it was short of.
+        #A noble may visit once owed nothing, or after gaining a card of colour index bonus if owed only that card.
+        owed = []
+        for n in buf[cs.NOBLES:cs.NOBLES+5]:
+            if n != EMPTY:
+                short,missing = 0,None
+                for i,cost in enumerate(NOBLE_COSTS[n]):
+                    if cards[i] < cost:
+                        short += cost - cards[i]
+                        missing = i
+                owed.append((short, missing))
+        potential = [k+1 for k,(short,_) in enumerate(owed) if not short] or [0]
+        def visits(bonus):
+            return [k+1 for k,(short,missing) in enumerate(owed) if not short or short==1 and missing==bonus] or [0]
+        ids = []
+        
+        #The IDs of a main action with each return combo (see return_combo_ids) and each potential noble.
+        def add(main, returns):
+            start = main*NUM_RETURNS
+            ids.extend((start+returned)*NUM_NOBLE_CHOICES + noble for returned in returns for noble in potential)
+        
+        #Collect up to 3 different gems.
+        available = tuple(k for k in range(len(CARD_COLOURS)) if board_gems[CARD_GEM[k]]>0)
+        num_held  = sum(held)
+        min_comb_len = min(3 if num_held<=7 else 2 if num_held==8 else 1, len(available))
+        for combo_length in range(max(min_comb_len, 1), min(len(available), 3) + 1):
+            for combo in itertools.combinations(available, combo_length):
+                main,collected = COLLECT_DIFF_MAINS[combo]
+                add(main, return_combo_ids(held, collected))
+        
+        #Collect 2 identical gems.
+        for k in range(len(CARD_COLOURS)):
+            if board_gems[CARD_GEM[k]] >= 4:
+                main,collected = COLLECT_SAME_MAINS[k]
+                add(main, return_combo_ids(held, collected))
+        
+        #Reserve a dealt card.
+        reserved = [c for c in buf[base+cs.RESERVED:base+cs.RESERVED+3] if c!=EMPTY]
+        dealt    = [slot for slot in range(12) if buf[cs.DEALT+slot]!=EMPTY]
+        if len(reserved) < 3:
+            collected = (0,)*YELLOW + (1 if board_gems[YELLOW]>0 else 0,) + (0,)*(len(GEM_COLOURS)-YELLOW-1)
+            for returned in return_combo_ids(held, collected):
+                for slot in dealt:
+                    start = ((RESERVE_MAIN+slot)*NUM_RETURNS + returned)*NUM_NOBLE_CHOICES
+                    ids.extend(start + noble for noble in potential)
+        
+        #Buy a dealt or reserved card, if affordable (see compact_payment): what the agent's cards and coloured gems
+        #don't cover must be covered by wilds.
+        wild = held[YELLOW]
+        for main,card_id in [(BUY_AVAILABLE_MAIN+slot, buf[cs.DEALT+slot]) for slot in dealt] + \
+                            [(BUY_RESERVE_MAIN+slot, card_id) for slot,card_id in enumerate(reserved)]:
+            colour = CARD_COLOUR[card_id]
+            if cards[colour] == 7:
+                continue
+            shortfall = 0
+            for k,cost,gem in CARD_COST_TERMS[card_id]:
+                if cost > cards[k] + held[gem]:
+                    shortfall += cost - cards[k] - held[gem]
+            if shortfall > wild:
+                continue
+            start = main*NUM_RETURNS*NUM_NOBLE_CHOICES
+            ids.extend(start + noble for noble in visits(colour))
+        
+        if not ids:
+            add(PASS_MAIN, (0,))
+        return ids
+
+    #Legal actions as a mask of length NUM_ACTIONS, for fixed-size policy outputs.
+    def legal_action_mask(self, state, agent_id):
+        mask = bytearray(NUM_ACTIONS)
+        for i in self.legal_action_ids(state, agent_id):
+            mask[i] = 1
+        return mask
+
+    #Return the action dict (as listed by getLegalActions) that action_id denotes in the given SplendorState.
+    def decode_action(self, action_id, state, agent_id):
+        main,returned,noble = split_action_id(action_id)
+        kind,arg = ACTION_MAINS[main]
+        agent,board = state.agents[agent_id],state.board
+        noble = board.nobles[noble-1] if noble else None
+        returned_gems = {c:n for c,n in zip(GEM_COLOURS, RETURN_VOCAB[returned]) if n}
+        if kind == 'collect_diff':
+            return {'type': kind, 'collected_gems': {c:1 for c in arg}, 'returned_gems': returned_gems, 'noble': noble}
+        if kind == 'collect_same':
+            return {'type': kind, 'collected_gems': {arg:2}, 'returned_gems': returned_gems, 'noble': noble}
+        if kind == 'reserve':
+            return {'type': kind, 'card': board.dealt[arg//4][arg%4],
+                    'collected_gems': {'yellow':1} if board.gems['yellow']>0 else {},
+                    'returned_gems': returned_gems, 'noble': noble}
+        if kind == 'pass':
+            return {'type': kind, 'noble': noble}
+        card = board.dealt[arg//4][arg%4] if kind=='buy_available' else agent.cards['yellow'][arg]
+        return {'type': kind, 'card': card, 'returned_gems': self.resources_sufficient(agent, card.cost), 'noble': noble}
+
+    #Inverse of decode_action: the ID of an action dict relative to the given SplendorState.
+    def encode_action(self, action, state, agent_id):
+        kind = action['type']
+        agent,board = state.agents[agent_id],state.board
+        if kind == 'collect_diff':
+            main = (kind, tuple(c for c in CARD_COLOURS if c in action['collected_gems']))
+        elif kind == 'collect_same':
+            main = (kind, next(iter(action['collected_gems'])))
+        elif kind in ('reserve', 'buy_available'):
+            dealt = [card.code if card else None for deck in board.dealt for card in deck]
+            main = (kind, dealt.index(action['card'].code))
+        elif kind == 'buy_reserve':
+            main = (kind, [card.code for card in agent.cards['yellow']].index(action['card'].code))
+        else:
+            main = (kind, None)
+        returned = 0
+        if 'collect' in kind or kind=='reserve':
+            returned = RETURN_INDEX[tuple(action['returned_gems'].get(c, 0) for c in GEM_COLOURS)]
+        noble = 0
+        if action['noble']:
+            noble = 1 + [n[0] for n in board.nobles].index(action['noble'][0])
+        return action_id(MAIN_INDEX[main], returned, noble)
+
+    #ID counterpart of generateCompactSuccessor. Cards are located by slot rather than searched for by code.
+    def apply_action_id(self, cstate, action_id, agent_id):
+        cs,buf = SplendorCompactState,cstate.buf
+        base = cstate.agent_base(agent_id)
+        main,returned,noble = split_action_id(action_id)
+        kind,arg = ACTION_MAINS[main]
+        score = 0
+        
+        if 'collect' in kind or kind=='reserve':
+            if kind == 'collect_diff':
+                for colour in arg:
+                    buf[cs.BOARD_GEMS+GEM_INDEX[colour]] -= 1
+                    buf[base+cs.GEMS+GEM_INDEX[colour]] += 1
+            elif kind == 'collect_same':
+                buf[cs.BOARD_GEMS+GEM_INDEX[arg]] -= 2
+                buf[base+cs.GEMS+GEM_INDEX[arg]] += 2
+            elif buf[cs.BOARD_GEMS+YELLOW]:
+                buf[cs.BOARD_GEMS+YELLOW] -= 1
+                buf[base+cs.GEMS+YELLOW] += 1
+            for i,count in enumerate(RETURN_VOCAB[returned]):
+                if count:
+                    buf[base+cs.GEMS+i] -= count
+                    buf[cs.BOARD_GEMS+i] += count
+            if kind == 'reserve':
+                card_id = buf[cs.DEALT+arg]
+                buf[cs.DEALT+arg] = cstate.deal(arg//4)
+                buf[self.find_slot(buf, base+cs.RESERVED, 3, EMPTY)] = card_id
+        
+        elif 'buy' in kind:
+            if kind == 'buy_available':
+                card_id = buf[cs.DEALT+arg]
+            else:
+                card_id = buf[base+cs.RESERVED+arg]
+            for i,count in enumerate(compact_payment(buf, base, card_id)):
+                if count:
+                    buf[base+cs.GEMS+i] -= count
+                    buf[cs.BOARD_GEMS+i] += count
+            if kind == 'buy_available':
+                buf[cs.DEALT+arg] = cstate.deal(arg//4)
+            else:
+                self.remove_slot(buf, base+cs.RESERVED, 3, card_id)
+            stack = base+cs.CARDS+CARD_COLOUR[card_id]
+            buf[cs.OWNERS+card_id] = agent_id<<3 | buf[stack]
+            buf[stack] += 1
+            score += CARD_POINTS[card_id]
+        
+        if noble:
+            noble_id = buf[cs.NOBLES+noble-1]
+            self.remove_slot(buf, cs.NOBLES, 5, noble_id)
+            buf[self.find_slot(buf, base+cs.OWN_NOBLES, 5, EMPTY)] = noble_id
+            score += 3
+        
+        buf[base+cs.SCORE] += score
+        buf[base+cs.PASSED] = kind=='pass'
+        buf[cs.TO_MOVE] = (agent_id + 1) % buf[cs.NUM_AGENTS]
+        return cstate
+
     #Game ends if any agent possesses at least 15 points, and all agents have gone in this round. As a very rare edge
     #case, poor playing agents might encounter a game where none are able to proceed. Game also ends in this case.
+    #Simulations should call is_terminal(state) instead, which reads the agent to move from the state itself.
     def gameEnds(self):
         deadlock = 0
         for agent in self.current_game_state.agents:
@@ -213,53 +1250,22 @@ class SplendorGameRule(GameRule):
         return deadlock==len(self.current_game_state.agents)
 
     #Return final score for this agent. If victories are tied, tie-break on number of cards placed by incrementing points.
+    #See scores(), which computes this for every agent from the state alone.
     def calScore(self, game_state, agent_id):
-        max_score = 0
-        details = []
-        bought_cards = lambda a : sum([len(cards) for colour,cards in a.cards.items() if colour!='yellow'])
-        for a in game_state.agents:
-            details.append((a.id, bought_cards(a), a.score))
-            max_score = max(a.score, max_score)
-        victors = [d for d in details if d[-1]==max_score]
-        if len(victors) > 1 and agent_id in [d[0] for d in victors]:
-            min_cards = min([d[1] for d in details])
-            if bought_cards(game_state.agents[agent_id])==min_cards:
-                # Add a half point if this agent was a tied victor, and had the fewest cards.
-                return game_state.agents[agent_id].score + .5
-        return game_state.agents[agent_id].score
+        return scores(game_state)[agent_id]
 
     #Generate a list of gem combinations that can be returned, if agent exceeds limit with collected gems.
     #Agents are disallowed from returning gems of the same colour as those they've just picked up. Since collected_gems
     #is sampled exhaustively, this function simply needs to screen out colours in collected_gems, in order for agents
-    #to be given all collected/returned combinations permissible.
+    #to be given all collected/returned combinations permissible. Combos are looked up in the shared RETURN_COMBOS table.
+    #An empty result indicates that the collected_gems combination is not viable.
     def generate_return_combos(self, current_gems, collected_gems):
-        total_gem_count = sum(current_gems.values()) + sum(collected_gems.values())
-        if total_gem_count > 10:
-            return_combos = []
-            num_return = total_gem_count - 10
-            #Combine current and collected gems. Screen out gem colours that were just collected.
-            total_gems = {i: current_gems.get(i, 0) + collected_gems.get(i, 0) for i in set(current_gems)}
-            total_gems = {i[0]:i[1] for i in total_gems.items() if i[0] not in collected_gems.keys()}.items()
-            #Form a total gems list (with elements == gem colours, and len == number of gems).
-            total_gems_list = []                    
-            for colour,count in total_gems:
-                for _ in range(count):
-                    total_gems_list.append(colour)
-            #If, after screening, there aren't enough gems that can be returned, return an empty list, indicating that 
-            #the collected_gems combination is not viable.
-            if len(total_gems_list) < num_return:
-                return []     
-            #Else, find all valid combinations of gems to return.               
-            for combo in set(itertools.combinations(total_gems_list, num_return)):
-                returned_gems = {c:0 for c in COLOURS.values()}
-                for colour in combo:
-                    returned_gems[colour] += 1
-                #Filter out colours with zero gems, and append.
-                return_combos.append(dict({i for i in returned_gems.items() if i[-1]>0}))
-                
-            return return_combos
-        
-        return [{}] #If no gems need to be returned, return a list comprised of one empty combo.
+        key = (tuple([current_gems.get(c, 0) for c in GEM_COLOURS]),
+               tuple([collected_gems.get(c, 0) for c in GEM_COLOURS]))
+        combos = RETURN_COMBOS.get(key)
+        if combos is None:
+            combos = RETURN_COMBOS[key] = build_return_combos(*key)
+        return combos
 
     #Checks to see whether an agent's purchased cards and collected gems can cover a given resource cost.
     #If it can, return the combination of gems to be returned, if any. If it can't, return False.
@@ -294,10 +1300,28 @@ class SplendorGameRule(GameRule):
                 return False
         return True
 
+    #Legal actions, memoized by (Zobrist hash, agent) if this rule has an action cache. Cached lists are shared, so each
+    #caller receives its own shallow copy of the list; the action dicts themselves must be treated as read-only.
+    #With an incremental generator, lists are built by it rather than from scratch.
     def getLegalActions(self, game_state, agent_id):
-        actions = []
-        agent,board = game_state.agents[agent_id], game_state.board
+        generate = self.move_generator.legal_actions if self.move_generator else self.generateLegalActions
+        if self.action_cache is None:
+            return generate(game_state, agent_id)
+        key = (game_state.zobrist, agent_id)
+        actions = self.action_cache.get(key)
+        if actions is None:
+            actions = generate(game_state, agent_id)
+            self.action_cache.put(key, actions)
+        return list(actions)
 
+    #Offer the agent's read-only views of the legal actions (see Game._StartTurn) to the shared cache, so that agents
+    #whose rules cache legal actions reuse them rather than regenerate them. The engine's own list, and agents' mutable
+    #deep copies (as under --copyStates), are never shared.
+    def shareLegalActions(self, game_state, agent_id, actions):
+        LEGAL_ACTION_CACHE.put((game_state.zobrist, agent_id), actions)
+
+    def generateLegalActions(self, game_state, agent_id):
+        agent,board = game_state.agents[agent_id], game_state.board
         
         #A given turn consists of the following:
         #  1. Collect gems (up to 3 different)    OR
@@ -316,17 +1340,36 @@ class SplendorGameRule(GameRule):
         # {'type': 'reserve', 'card':card, 'collected_gems': {'yellow': 1/None}, 'returned_gems': {colour: 1/None}, 'noble': noble}
         # {'type': 'buy_available'/'buy_reserve', 'card': card, 'returned_gems': {gem counts}, 'noble': noble}
         
-        #First, check if any nobles are waiting to visit from the last turn. Ensure each action to follow recognises
-        #this, and in the exceedingly rare case that there are multiple nobles waiting (meaning that, at the last turn,
-        #this agent had the choice of at least 3 nobles), multiply all generated actions by these nobles to allow the
-        #agent to choose again.
+        #Each part of the list is generated by its own method below, such that LegalActionGenerator can regenerate
+        #only the parts that a move has affected.
+        potential_nobles = self.potential_nobles(agent, board)
+        actions = self.collect_actions(agent, board, potential_nobles) + \
+                  self.reserve_actions(agent, board, potential_nobles) + \
+                  self.buy_actions(agent, board)
+        
+        #Return list of actions. If there are no actions (almost impossible), all this player can do is pass.
+        #A noble is still permitted to visit if conditions are met.
+        if not actions:
+            for noble in potential_nobles:
+                actions.append({'type': 'pass', 'noble':noble})
+                
+        return actions
+
+    #First, check if any nobles are waiting to visit from the last turn. Ensure each action to follow recognises
+    #this, and in the exceedingly rare case that there are multiple nobles waiting (meaning that, at the last turn,
+    #this agent had the choice of at least 3 nobles), multiply all generated actions by these nobles to allow the
+    #agent to choose again.
+    def potential_nobles(self, agent, board):
         potential_nobles = []
         for noble in board.nobles:
             if self.noble_visit(agent, noble):
                 potential_nobles.append(noble)
         if len(potential_nobles) == 0:
             potential_nobles = [None]
-        
+        return potential_nobles
+
+    def collect_actions(self, agent, board, potential_nobles):
+        actions = []
         #Generate actions (collect up to 3 different gems). Work out all legal combinations. Theoretical max is 10.
         available_colours = [colour for colour,number in board.gems.items() if colour!='yellow' and number>0]
         num_holding_gem = sum(agent.gems.values())
@@ -369,12 +1412,15 @@ class SplendorGameRule(GameRule):
                                     'collected_gems': collected_gems,
                                     'returned_gems': returned_gems,
                                     'noble': noble})  
+        return actions
 
-        #Generate actions (reserve card). Agent can reserve only if it possesses < 3 cards currently reserved.
-        #With a reservation, the agent will receive one seal (yellow), if there are any left. Reservations are stored
-        #and displayed under the agent's yellow stack, as they won't generate their true colour until fully purchased.
-        #There is a possible 12 cards to be reserved, and if the agent goes over limit, there are max 6 gem colours
-        #that can be returned, leading to a theoretical max of 72 actions here.
+    #Generate actions (reserve card). Agent can reserve only if it possesses < 3 cards currently reserved.
+    #With a reservation, the agent will receive one seal (yellow), if there are any left. Reservations are stored
+    #and displayed under the agent's yellow stack, as they won't generate their true colour until fully purchased.
+    #There is a possible 12 cards to be reserved, and if the agent goes over limit, there are max 6 gem colours
+    #that can be returned, leading to a theoretical max of 72 actions here.
+    def reserve_actions(self, agent, board, potential_nobles):
+        actions = []
         if len(agent.cards['yellow']) < 3:
             collected_gems = {'yellow':1} if board.gems['yellow']>0 else {}
             return_combos = self.generate_return_combos(agent.gems, collected_gems)
@@ -387,46 +1433,120 @@ class SplendorGameRule(GameRule):
                                             'collected_gems': collected_gems,
                                             'returned_gems': returned_gems,
                                             'noble': noble})
+        return actions
             
-        #Generate actions (buy card). Agents can buy cards if they can cover its resource cost. Resources can come from
-        #an agent's gem and card stacks. Card stacks represent gem factories, or 'permanent gems'; if there are 2 blue 
-        #cards already purchased, this acts like 2 extra blue gems to spend in a given turn. Gems are therefore only 
-        #returned if the stack of that colour is insufficient to cover the cost.
-        #Agents are disallowed from purchasing > 7 cards of any one colour, for the purposes of a clean interface. 
-        #This is not expected to affect gameplay, as there is essentially zero strategic reason to exceed this limit.
-        #Available cards consist of cards dealt onto the board, as well as cards previously reserved by this agent.
-        #There is a max 15 actions that can be generated here (15 possible cards to be bought: 12 dealt + 3 reserved).
-        #However, in the case that multiple nobles are made candidates for visiting with this move, this number will
-        #be multiplied accordingly. This however, is a rare event.
-        for card in board.dealt_list() + agent.cards['yellow']:
-            if not card or len(agent.cards[card.colour]) == 7:
-                continue
-            returned_gems = self.resources_sufficient(agent, card.cost) #Check if this card is affordable.
-            if type(returned_gems)==dict: #If a dict was returned, this means the agent possesses sufficient resources.
-                #Check to see if the acquisition of a new card has meant new nobles becoming candidates to visit.
-                new_nobles = []
-                for noble in board.nobles:
-                    agent_post_action = copy.deepcopy(agent)
-                    #Give the card featured in this action to a copy of the agent.
-                    agent_post_action.cards[card.colour].append(card)
-                    #Use this copied agent to check whether this noble can visit.
-                    if self.noble_visit(agent_post_action, noble):
-                        new_nobles.append(noble) #If so, add noble to the new list.
-                if not new_nobles:
-                    new_nobles = [None]
+    #Generate actions (buy card). Agents can buy cards if they can cover its resource cost. Resources can come from
+    #an agent's gem and card stacks. Card stacks represent gem factories, or 'permanent gems'; if there are 2 blue 
+    #cards already purchased, this acts like 2 extra blue gems to spend in a given turn. Gems are therefore only 
+    #returned if the stack of that colour is insufficient to cover the cost.
+    #Agents are disallowed from purchasing > 7 cards of any one colour, for the purposes of a clean interface. 
+    #This is not expected to affect gameplay, as there is essentially zero strategic reason to exceed this limit.
+    #Available cards consist of cards dealt onto the board, as well as cards previously reserved by this agent.
+    #There is a max 15 actions that can be generated here (15 possible cards to be bought: 12 dealt + 3 reserved).
+    #However, in the case that multiple nobles are made candidates for visiting with this move, this number will
+    #be multiplied accordingly. This however, is a rare event.
+    #Affordability and noble eligibility for all candidate cards are computed at once by purchase_kernel, unless
+    #precomputed rows (for the dealt cards followed by the reserved cards) are passed in as kernel.
+    def buy_actions(self, agent, board, kernel=None):
+        actions = []
+        dealt = board.dealt_list()
+        candidates = dealt + agent.cards['yellow']
+        if candidates:
+            affordable,payments,visits = kernel or purchase_kernel(agent, candidates, board.nobles)
+            payments = payments.tolist() if isinstance(payments, np.ndarray) else payments
+            for i,card in enumerate(candidates):
+                if not affordable[i] or len(agent.cards[card.colour]) == 7:
+                    continue
+                returned_gems = FrozenGems((c,n) for c,n in zip(GEM_COLOURS, payments[i]) if n)
+                #Nobles that become candidates to visit with the acquisition of this card.
+                new_nobles = [noble for noble,visit in zip(board.nobles, visits[i]) if visit] or [None]
                 for noble in new_nobles:
-                    actions.append({'type': 'buy_reserve' if card in agent.cards['yellow'] else 'buy_available',
+                    actions.append({'type': 'buy_reserve' if i >= len(dealt) else 'buy_available',
                                     'card': card,
                                     'returned_gems': returned_gems,
                                     'noble': noble})
-        
-        #Return list of actions. If there are no actions (almost impossible), all this player can do is pass.
-        #A noble is still permitted to visit if conditions are met.
+        return actions
+
+
+#Incremental counterpart of SplendorGameRule.generateLegalActions, producing identical lists. For each agent it keeps
+#the parts of its previous list, each with the inputs it was built from, and regenerates only the parts whose inputs
+#the moves since have changed:
+#  nobles waiting to visit:  the agent's bonuses and the board's nobles
+#  collect actions:          board gems, the agent's gems (which fix the return-combo class) and waiting nobles
+#  reserve actions:          reservability (reserved count, yellow on the board), the agent's gems, dealt cards, nobles
+#  buy actions:              dealt and reserved cards, on top of per-card affordability rows
+#Affordability rows depend only on the agent's gems, bonuses and the board's nobles. While those stand, a deal only
+#costs a row for the newly dealt card; otherwise rows are rebuilt in full. Counters record parts reused and rebuilt.
+class LegalActionGenerator():
+    def __init__(self, rule):
+        self.rule     = rule
+        self.memo     = {}
+        self.reused   = 0
+        self.rebuilt  = 0
+
+    def part(self, memo, name, key, build):
+        entry = memo.get(name)
+        if entry is not None and entry[0]==key:
+            self.reused += 1
+            return entry[1]
+        self.rebuilt += 1
+        value = build()
+        memo[name] = (key, value)
+        return value
+
+    def legal_actions(self, state, agent_id):
+        rule,agent,board = self.rule,state.agents[agent_id],state.board
+        memo = self.memo.setdefault(agent_id, {})
+        gems     = tuple([agent.gems[c] for c in GEM_COLOURS])
+        bonuses  = tuple([len(agent.cards[c]) for c in CARD_COLOURS])
+        nobles   = tuple([noble[0] for noble in board.nobles])
+        dealt    = tuple(board.dealt_list())
+        reserved = tuple(agent.cards['yellow'])
+        waiting  = self.part(memo, 'nobles', (bonuses, nobles), lambda : rule.potential_nobles(agent, board))
+        visiting = tuple([noble[0] if noble else None for noble in waiting])
+        #Gems held only matter to collecting and reserving through the returns they force. Holding at most 7 (or 9, for
+        #a reservation), no collection (of at most 3) forces a return, so only the number held is significant.
+        held     = sum(gems)
+        stacks   = tuple([(n>0) + (n>=4) for n in board.gems.values()])
+        collect  = self.part(memo, 'collect', (stacks, gems if held>7 else None, visiting),
+                             lambda : rule.collect_actions(agent, board, waiting))
+        reserve  = self.part(memo, 'reserve', (len(reserved)<3, board.gems['yellow']>0, gems if held>9 else None, dealt,
+                                               visiting), lambda : rule.reserve_actions(agent, board, waiting))
+        buy      = self.part(memo, 'buy', (gems, bonuses, nobles, dealt, reserved),
+                             lambda : rule.buy_actions(agent, board, self.kernel(memo, agent, board, (gems, bonuses, nobles))))
+        actions  = collect + reserve + buy
         if not actions:
-            for noble in potential_nobles:
-                actions.append({'type': 'pass', 'noble':noble})
-                
+            actions = [{'type': 'pass', 'noble':noble} for noble in waiting]
         return actions
 
+    #purchase_kernel rows for the agent's candidate cards. When the agent's economy (gems, bonuses and board nobles) has
+    #changed, every row is recomputed by one kernel call. Otherwise only a deal can have changed the candidates, and
+    #rows are reused, with the one or two newly dealt cards computed directly.
+    def kernel(self, memo, agent, board, economy):
+        candidates = board.dealt_list() + agent.cards['yellow']
+        if not candidates:
+            return None
+        entry = memo.get('kernel')
+        if entry is None or entry[0]!=economy:
+            affordable,payments,visits = purchase_kernel(agent, candidates, board.nobles)
+            rows = {card.id:row for card,row in zip(candidates, zip(affordable.tolist(), payments.tolist(), visits.tolist()))}
+            memo['kernel'] = (economy, rows)
+        else:
+            rows = entry[1]
+            gems,bonuses,_ = economy
+            for card in candidates:
+                if card.id not in rows:
+                    paid = [0]*len(GEM_COLOURS)
+                    for k,cost in enumerate(card.cost_vector):
+                        gem_cost  = max(cost - bonuses[k], 0)
+                        shortfall = max(gem_cost - gems[CARD_GEM[k]], 0)
+                        paid[CARD_GEM[k]] = gem_cost - shortfall
+                        paid[YELLOW] += shortfall
+                    post = list(bonuses)
+                    post[card.colour_index] += 1
+                    visits = [all(b>=c for b,c in zip(post, NOBLE_COSTS[NOBLE_INDEX[noble[0]]])) for noble in board.nobles]
+                    rows[card.id] = (paid[YELLOW] <= gems[YELLOW], paid, visits)
+        return tuple(zip(*[rows[card.id] for card in candidates]))
+
 
 # END FILE -----------------------------------------------------------------------------------------------------------#
@@ -4,6 +4,11 @@
 # Date:    04/01/2021
 # Purpose: Implements "Splendor" for the COMP90054 competitive game environment
 
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+
+from collections import OrderedDict
+
 # CONSTANTS ----------------------------------------------------------------------------------------------------------#
 
 
@@ -135,11 +140,169 @@ def convert_filename(filename):
     return colour,code,cost
 
 # Bundle together an agent's activity in the game for use in updating a policy.
+# Traces are append-only and structurally shared: each entry is an immutable node pointing at the previous one, so
+# copying a trace (e.g. when Game.Run or an agent deepcopies a state) costs the same however long the game has run.
+# A trace may be bounded to its most recent limit entries (a limit of 0 records nothing), for use in simulations.
 class AgentTrace:
-    def __init__(self, pid):
+    def __init__(self, pid, limit=None):
         self.id = pid
-        self.action_reward = [] # Turn-by-turn history consisting of (action,reward) tuples.
-    
+        self.limit = limit
+        self.history = None # Newest TraceNode, or None if empty.
+
+    # Turn-by-turn history consisting of (action,reward) tuples, oldest first.
+    @property
+    def action_reward(self):
+        return tuple(self.history.entries()) if self.history else ()
+
+    def append(self, entry):
+        if self.limit == 0:
+            return
+        self.history = TraceNode(entry, self.history)
+        if self.limit is not None and self.history.length > self.limit:
+            self.history = TraceNode.build(self.history.entries()[-self.limit:])
+
+    def __len__(self):
+        return self.history.length if self.history else 0
+
+    # Traces pickled before histories were shared carry a plain action_reward list.
+    def __setstate__(self, state):
+        entries = state.pop('action_reward', None)
+        self.__dict__.update(state)
+        self.__dict__.setdefault('limit', None)
+        if entries is not None:
+            self.history = TraceNode.build(entries)
+
+class TraceNode:
+    __slots__ = ('entry', 'parent', 'length')
+    def __init__(self, entry, parent=None):
+        self.entry  = entry
+        self.parent = parent
+        self.length = parent.length+1 if parent else 1
+
+    @staticmethod
+    def build(entries, parent=None):
+        for entry in entries:
+            parent = TraceNode(entry, parent)
+        return parent
+
+    def entries(self):
+        node,out = self,[]
+        while node:
+            out.append(node.entry)
+            node = node.parent
+        return out[::-1]
+
+    # Nodes are never mutated, so copies share them. Pickle flat, to avoid recursing once per node.
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
+    def __reduce__(self):
+        return (TraceNode.build, (tuple(self.entries()),))
+
+# Bounded transposition table for search agents, keyed by 64-bit state hashes (e.g. SplendorState.zobrist, or
+# splendor_model.canonical_hash to also merge positions that differ only in layout). Entries live in a fixed number of
+# slots indexed by key; a new entry replaces the slot's occupant if the occupant was stored in an earlier search (see
+# new_search), or was searched to no greater depth. Otherwise the new entry is dropped.
+class TranspositionTable:
+    def __init__(self, capacity=1<<16):
+        self.capacity = capacity
+        self.keys     = [None]*capacity
+        self.depths   = [0]*capacity
+        self.ages     = [0]*capacity
+        self.values   = [None]*capacity
+        self.age      = 0
+        self.hits     = 0
+        self.misses   = 0
+
+    # Mark the start of a new search (e.g. a new move), so that entries from earlier searches become replaceable.
+    def new_search(self):
+        self.age += 1
+
+    # Return the value stored for key, or default if absent.
+    def get(self, key, default=None):
+        i = key % self.capacity
+        if self.keys[i] == key:
+            self.hits += 1
+            self.ages[i] = self.age
+            return self.values[i]
+        self.misses += 1
+        return default
+
+    # Store value for key, searched to the given depth. Returns whether the entry was kept.
+    def put(self, key, value, depth=0):
+        i = key % self.capacity
+        if self.keys[i] is None or self.keys[i] == key or self.ages[i] != self.age or depth >= self.depths[i]:
+            self.keys[i], self.values[i], self.depths[i], self.ages[i] = key, value, depth, self.age
+            return True
+        return False
+
+    def __contains__(self, key):
+        return self.keys[key % self.capacity] == key
+
+    def __len__(self):
+        return sum(1 for k in self.keys if k is not None)
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+# Bounded cache with least-recently-used eviction, counting hits and misses.
+class LRUCache:
+    def __init__(self, capacity=1<<12):
+        self.capacity = capacity
+        self.entries  = OrderedDict()
+        self.hits     = 0
+        self.misses   = 0
+
+    def get(self, key, default=None):
+        value = self.entries.get(key, self)
+        if value is self:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+# SplitMix64 step: advance a 64-bit state and return (new_state, output). Kept as a plain function so that byte- and
+# array-backed states can carry their generator as a single integer.
+MASK64 = (1<<64) - 1
+def splitmix64(state):
+    state = (state + 0x9E3779B97F4A7C15) & MASK64
+    z = ((state ^ (state >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return state, z ^ (z >> 31)
+
+# Lightweight per-state random number generator. Its whole state is one 64-bit integer, so copying a game state copies
+# its generator for free, and simulations never touch the global random module.
+class StateRNG:
+    __slots__ = ('state',)
+    def __init__(self, seed=0):
+        self.state = seed & MASK64
+
+    def seed(self, seed):
+        self.state = seed & MASK64
+
+    # Uniform integer in [0, n), by multiply-shift on a 64-bit output.
+    def randbelow(self, n):
+        self.state, z = splitmix64(self.state)
+        return (z * n) >> 64
+
 def GemsToString(gem_dict):
     gem_counts = list(gem_dict.items())
     if len(gem_counts)==1:
@@ -0,0 +1,308 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Batched, structure-of-arrays Splendor environment for mass self-play and training data generation
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+
+import random, sys
+import numpy as np
+from Splendor.splendor_model import *
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+
+#Per-action-main lookup tables, indexed like ACTION_MAINS. Kinds are numbered in ACTION_MAINS order.
+DIFF, SAME, RESERVE, BUY_AVAILABLE, BUY_RESERVE, PASS = range(6)
+KINDS       = ['collect_diff', 'collect_same', 'reserve', 'buy_available', 'buy_reserve', 'pass']
+MAIN_KIND   = np.array([KINDS.index(kind) for kind,_ in ACTION_MAINS])
+MAIN_SLOT   = np.array([arg if kind in KINDS[RESERVE:PASS] else 0 for kind,arg in ACTION_MAINS])
+MAIN_GEMS   = np.zeros((len(ACTION_MAINS), len(GEM_COLOURS)), dtype=np.int16) #Gems collected by collect mains.
+for i,(kind,arg) in enumerate(ACTION_MAINS):
+    for colour in (arg if kind=='collect_diff' else [arg] if kind=='collect_same' else []):
+        MAIN_GEMS[i, GEM_INDEX[colour]] = 1 if kind=='collect_diff' else 2
+KIND_MAINS  = {kind:np.nonzero(MAIN_KIND==k)[0] for k,kind in enumerate(KINDS)}
+#Each kind's mains are contiguous.
+KIND_SLICES = {kind:slice(mains[0], mains[-1]+1) for kind,mains in KIND_MAINS.items()}
+#Mains that may need gems returned, in order: collect_diff, collect_same, and (as one option) reserve.
+RETURN_OPTIONS = np.concatenate([KIND_MAINS['collect_diff'], KIND_MAINS['collect_same'], KIND_MAINS['reserve'][:1]])
+DIFF_COLOURS   = MAIN_GEMS[KIND_MAINS['collect_diff']][:, CARD_GEM] > 0 #[25, card colours]
+
+RETURN_VECTORS = np.array(RETURN_VOCAB, dtype=np.int16)
+RETURN_SIZES   = RETURN_VECTORS.sum(axis=1)
+#Legal returns, indexed by (returnable gems capped at 3 per colour, as a base-4 code) * 4 + number to return. At most
+#3 gems are ever returned, so capping loses nothing, and the table is small enough (16384 x 84) to build at import.
+RETURN_BASE    = 4**np.arange(len(GEM_COLOURS))
+_capped        = (np.arange(4**len(GEM_COLOURS))[:, None] // RETURN_BASE) % 4
+RETURN_TABLE   = ((RETURN_SIZES[None, None, :] == np.arange(4)[None, :, None]) &
+                  (RETURN_VECTORS[None, None, :, :] <= _capped[:, None, None, :]).all(axis=3)).reshape(-1, NUM_RETURNS)
+CARD_COLOUR_ARRAY = np.array(CARD_COLOUR + [0])  #Trailing entries let EMPTY slots (mapped to index -1) be looked up.
+CARD_POINTS_ARRAY = np.array(CARD_POINTS + [0])
+CARD_COSTS_PADDED = np.concatenate([CARD_COST_MATRIX, np.zeros((1, len(CARD_COLOURS)), dtype=np.int16)])
+NOBLE_COSTS_PADDED = np.concatenate([NOBLE_COST_MATRIX, np.full((1, len(CARD_COLOURS)), 99, dtype=np.int16)])
+MAX_DECK = max(DECK_SIZES)
+
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+
+#Holds N games of Splendor as arrays with a leading game axis, and steps them all at once using the integer action IDs
+#of splendor_model. Each game is set up from a random.Random instance exactly as SplendorState is from the global random
+#module, and then deals from its own SplitMix64 state exactly as BoardState.deal does, so a game reset with seed s
+#replays identically to SplendorGameRule.generateSuccessor applied to SplendorState(num_agents) after random.seed(s).
+#Card and noble slots hold IDs, with EMPTY marking vacancies, mirroring SplendorCompactState.
+class SplendorVectorEnv():
+    def __init__(self, num_games, num_agents=2):
+        self.num_games  = num_games
+        self.num_agents = num_agents
+        self.rngs = [0]*num_games #Per-game generator states, as held by StateRNG.
+        N,P = num_games,num_agents
+        self.board_gems = np.zeros((N, len(GEM_COLOURS)), dtype=np.int16)
+        self.dealt      = np.full((N, 12), EMPTY, dtype=np.int16)
+        self.nobles     = np.full((N, 5), EMPTY, dtype=np.int16)
+        self.decks      = np.full((N, 3, MAX_DECK), EMPTY, dtype=np.int16)
+        self.deck_lens  = np.zeros((N, 3), dtype=np.int16)
+        self.gems       = np.zeros((N, P, len(GEM_COLOURS)), dtype=np.int16)
+        self.cards      = np.zeros((N, P, len(CARD_COLOURS)), dtype=np.int16)
+        self.reserved   = np.full((N, P, 3), EMPTY, dtype=np.int16)
+        self.own_nobles = np.full((N, P, 5), EMPTY, dtype=np.int16)
+        self.owners     = np.full((N, len(CARDS)), EMPTY, dtype=np.int16) #(agent << 3 | stack position), as compact.
+        self.scores     = np.zeros((N, P), dtype=np.int16)
+        self.passed     = np.zeros((N, P), dtype=bool)
+        self.to_move    = np.zeros(N, dtype=np.int16)
+
+    #Start a fresh game per seed, dealing as SplendorState(num_agents) would after random.seed(seed).
+    def reset(self, seeds):
+        assert len(seeds) == self.num_games
+        n = [4,5,7][self.num_agents-2]
+        self.board_gems[:] = [n if c!='yellow' else 5 for c in GEM_COLOURS]
+        for arr in (self.dealt, self.nobles, self.decks, self.reserved, self.own_nobles, self.owners):
+            arr[:] = EMPTY
+        for arr in (self.gems, self.cards, self.scores, self.passed, self.to_move):
+            arr[:] = 0
+        for g,seed in enumerate(seeds):
+            rng = random.Random(seed)
+            self.rngs[g] = rng.getrandbits(64)
+            nobles = rng.sample(NOBLES, k=self.num_agents+1)
+            self.nobles[g, :len(nobles)] = [NOBLE_INDEX[code] for code,_ in nobles]
+            for deck_id in range(3):
+                deck = [card.id for card in CARD_REGISTRY if card.deck_id==deck_id]
+                rng.shuffle(deck)
+                self.decks[g, deck_id, :len(deck)] = deck
+                self.deck_lens[g, deck_id] = len(deck)
+            for slot in range(12):
+                self.dealt[g, slot] = self.deal(g, slot//4)
+        return self
+
+    #Draw a random card from the game's remaining deck by swap-and-pop, exactly as BoardState.deal does. Returns EMPTY
+    #if exhausted.
+    def deal(self, g, deck_id):
+        n = int(self.deck_lens[g, deck_id])
+        if not n:
+            return EMPTY
+        self.rngs[g],z = splitmix64(self.rngs[g])
+        deck = self.decks[g, deck_id]
+        i = (z*n) >> 64
+        card_id = int(deck[i])
+        deck[i],deck[n-1] = deck[n-1],EMPTY
+        self.deck_lens[g, deck_id] = n-1
+        return card_id
+
+    #Games that SplendorGameRule.gameEnds would report as over: a round has completed with someone on 15 or more
+    #points, or every agent has passed.
+    def done(self):
+        return ((self.scores >= 15).any(axis=1) & (self.to_move == 0)) | self.passed.all(axis=1)
+
+    #Return a [num_games, NUM_ACTIONS] boolean mask of the legal action IDs of the agent to move in each game. Finished
+    #games have no legal actions.
+    def legal_mask(self):
+        N,G = self.num_games,np.arange(self.num_games)
+        mover   = self.to_move
+        held    = self.gems[G, mover]                     #[N, gems]
+        bonuses = self.cards[G, mover]                    #[N, card colours]
+        mask    = np.zeros((N, len(ACTION_MAINS), NUM_RETURNS, NUM_NOBLE_CHOICES), dtype=bool)
+
+        #Noble choices available before any purchase: 0 (none) if no board noble is eligible, else each eligible slot.
+        noble_costs = NOBLE_COSTS_PADDED[np.where(self.nobles==EMPTY, -1, self.nobles)]       #[N, slots, colours]
+        potential   = (bonuses[:, None, :] >= noble_costs).all(axis=2)
+        choices     = np.concatenate([~potential.any(axis=1, keepdims=True), potential], axis=1) #[N, 6]
+
+        #Legal gem returns per return option. Collected colours may not be returned, and exactly max(0, total-10)
+        #gems must be returned: a vocabulary entry is legal if it has that size and fits within the returnable gems.
+        collected = np.repeat(MAIN_GEMS[RETURN_OPTIONS][None], N, axis=0)                   #[N, options, gems]
+        collected[:, -1, YELLOW] = self.board_gems[:, YELLOW] > 0
+        num_return = np.maximum(held.sum(axis=1)[:, None] + collected.sum(axis=2) - 10, 0)  #[N, options]
+        returnable = np.where(collected > 0, 0, held[:, None, :] + collected)
+        codes      = (np.minimum(returnable, 3) * RETURN_BASE).sum(axis=2) * 4 + num_return
+        returns_ok = np.where((num_return <= 3)[:, :, None], RETURN_TABLE[np.minimum(codes, len(RETURN_TABLE)-1)],
+                              False)                                                     #[N, options, returns]
+
+        #Collect different: every colour must be available, and at least min(3/2/1, available) colours taken when
+        #holding <=7/8/9+ gems.
+        available  = self.board_gems[:, CARD_GEM] > 0
+        num_held   = held.sum(axis=1)
+        min_len    = np.minimum(np.where(num_held<=7, 3, np.where(num_held==8, 2, 1)), available.sum(axis=1))
+        diff_len   = DIFF_COLOURS.sum(axis=1)
+        diff_ok    = (available[:, None, :] | ~DIFF_COLOURS[None]).all(axis=2) & \
+                     (diff_len[None, :] >= np.maximum(min_len, 1)[:, None])
+        same_ok    = self.board_gems[:, CARD_GEM] >= 4
+        reserve_ok = (self.dealt != EMPTY) & ((self.reserved[G, mover] != EMPTY).sum(axis=1) < 3)[:, None]
+        n_diff,n_same = len(KIND_MAINS['collect_diff']),len(KIND_MAINS['collect_same'])
+        for mains,ok,returns in [(KIND_SLICES['collect_diff'], diff_ok, returns_ok[:, :n_diff]),
+                                 (KIND_SLICES['collect_same'], same_ok, returns_ok[:, n_diff:n_diff+n_same]),
+                                 (KIND_SLICES['reserve'], reserve_ok, returns_ok[:, -1:])]:
+            legal = ok[:, :, None] & returns
+            #Broadcast noble choice by choice (most are never available), rather than over a trailing axis of 6.
+            for k in np.nonzero(choices.any(axis=0))[0]:
+                np.logical_and(legal, choices[:, k, None, None], out=mask[:, mains, :, k])
+
+        #Buy a dealt or reserved card: the agent must afford it and hold fewer than 7 cards of its colour. Noble choices
+        #are those eligible once the card's bonus is added.
+        candidates = np.concatenate([self.dealt, self.reserved[G, mover]], axis=1)          #[N, 15]
+        ids        = np.where(candidates==EMPTY, -1, candidates)
+        gem_cost   = np.maximum(CARD_COSTS_PADDED[ids] - bonuses[:, None, :], 0)
+        shortfall  = np.maximum(gem_cost - held[:, None, CARD_GEM], 0)
+        colours    = CARD_COLOUR_ARRAY[ids]
+        buy_ok     = (candidates != EMPTY) & (shortfall.sum(axis=2) <= held[:, None, YELLOW]) & \
+                     (np.take_along_axis(bonuses, colours, axis=1) < 7)
+        post       = bonuses[:, None, :] + np.eye(len(CARD_COLOURS), dtype=np.int16)[colours]
+        visits     = (post[:, :, None, :] >= noble_costs[:, None, :, :]).all(axis=3)       #[N, 15, slots]
+        buy_choices = np.concatenate([~visits.any(axis=2, keepdims=True), visits], axis=2)
+        buy_mains  = slice(KIND_SLICES['buy_available'].start, KIND_SLICES['buy_reserve'].stop)
+        mask[:, buy_mains, 0, :] = buy_ok[:, :, None] & buy_choices
+
+        #Pass only if nothing else is possible.
+        mask = mask.reshape(N, NUM_ACTIONS)
+        stuck = ~mask.any(axis=1)
+        pass_ids = action_id(KIND_MAINS['pass'][0]) + np.arange(NUM_NOBLE_CHOICES)
+        mask[:, pass_ids] = stuck[:, None] & choices
+        mask[self.done()] = False
+        return mask
+
+    #Apply one action ID per game for the agent to move. Games that are done, or given a negative ID, are left as-is.
+    def step(self, action_ids):
+        action_ids = np.asarray(action_ids)
+        N,G = self.num_games,np.arange(self.num_games)
+        active = (action_ids >= 0) & ~self.done()
+        ids    = np.where(active, action_ids, action_id(KIND_MAINS['pass'][0]))
+        rest,noble = np.divmod(ids, NUM_NOBLE_CHOICES)
+        main,ret   = np.divmod(rest, NUM_RETURNS)
+        kind,slot  = MAIN_KIND[main],MAIN_SLOT[main]
+        mover = self.to_move.copy()
+        held  = self.gems[G, mover]
+
+        #Gem transfers: collected gems in, returned gems and card payments out.
+        delta = MAIN_GEMS[main].copy()
+        reserving = kind==RESERVE
+        delta[:, YELLOW] += reserving & (self.board_gems[:, YELLOW] > 0)
+        delta -= np.where((kind <= RESERVE)[:, None], RETURN_VECTORS[ret], 0)
+        buying = (kind==BUY_AVAILABLE) | (kind==BUY_RESERVE)
+        card = np.where(kind==BUY_RESERVE, self.reserved[G, mover, np.minimum(slot, 2)], self.dealt[G, slot])
+        card = np.where(buying | reserving, card, EMPTY)
+        card_idx  = np.where(card==EMPTY, -1, card)
+        gem_cost  = np.maximum(CARD_COSTS_PADDED[card_idx] - self.cards[G, mover], 0)
+        shortfall = np.maximum(gem_cost - held[:, CARD_GEM], 0)
+        payment   = np.zeros_like(delta)
+        payment[:, CARD_GEM] = gem_cost - shortfall
+        payment[:, YELLOW]   = shortfall.sum(axis=1)
+        delta -= np.where(buying[:, None], payment, 0)
+        delta[~active] = 0
+        self.gems[G, mover] += delta
+        self.board_gems -= delta
+
+        #Card movements. Deals and slot shifts touch few games per step, so are done game by game.
+        for g in np.nonzero(active & (reserving | (kind==BUY_AVAILABLE)))[0]:
+            self.dealt[g, slot[g]] = self.deal(g, slot[g]//4)
+        for g in np.nonzero(active & reserving)[0]:
+            reserved = self.reserved[g, mover[g]]
+            reserved[(reserved != EMPTY).sum()] = card[g]
+        for g in np.nonzero(active & (kind==BUY_RESERVE))[0]:
+            reserved = self.reserved[g, mover[g]]
+            reserved[slot[g]:] = np.append(reserved[slot[g]+1:], EMPTY)
+        bought = np.nonzero(active & buying)[0]
+        colours = CARD_COLOUR_ARRAY[card_idx[bought]]
+        self.owners[bought, card[bought]] = mover[bought]<<3 | self.cards[bought, mover[bought], colours]
+        self.cards[bought, mover[bought], colours] += 1
+        points = np.where(active & buying, CARD_POINTS_ARRAY[card_idx], 0)
+
+        #Noble visits.
+        visited = np.nonzero(active & (noble > 0))[0]
+        for g in visited:
+            noble_id = self.nobles[g, noble[g]-1]
+            self.nobles[g, noble[g]-1:] = np.append(self.nobles[g, noble[g]:], EMPTY)
+            own = self.own_nobles[g, mover[g]]
+            own[(own != EMPTY).sum()] = noble_id
+        points[visited] += 3
+
+        self.scores[G, mover] += points.astype(np.int16)
+        self.passed[G[active], mover[active]] = kind[active]==PASS
+        self.to_move = np.where(active, (mover + 1) % self.num_agents, mover).astype(np.int16)
+        return self
+
+    #Game g as a SplendorCompactState, for inspection or comparison against the reference model.
+    def to_compact(self, g):
+        cs = SplendorCompactState(self.num_agents)
+        buf = cs.buf
+        buf[cs.TO_MOVE] = int(self.to_move[g])
+        buf[cs.RNG:cs.RNG+8] = self.rngs[g].to_bytes(8, 'little')
+        buf[cs.BOARD_GEMS:cs.BOARD_GEMS+len(GEM_COLOURS)] = bytes(self.board_gems[g].tolist())
+        buf[cs.DEALT:cs.DEALT+12] = bytes(self.dealt[g].tolist())
+        buf[cs.NOBLES:cs.NOBLES+5] = bytes(self.nobles[g].tolist())
+        buf[cs.DECK_LENS:cs.DECK_LENS+3] = bytes(self.deck_lens[g].tolist())
+        for deck_id in range(3):
+            n = self.deck_lens[g, deck_id]
+            buf[cs.DECK_OFFSETS[deck_id]:cs.DECK_OFFSETS[deck_id]+n] = bytes(self.decks[g, deck_id, :n].tolist())
+        buf[cs.OWNERS:cs.OWNERS+len(CARDS)] = bytes(self.owners[g].tolist())
+        for a in range(self.num_agents):
+            base = cs.agent_base(a)
+            buf[base+cs.SCORE]  = int(self.scores[g, a])
+            buf[base+cs.PASSED] = int(self.passed[g, a])
+            buf[base+cs.GEMS:base+cs.GEMS+len(GEM_COLOURS)]      = bytes(self.gems[g, a].tolist())
+            buf[base+cs.CARDS:base+cs.CARDS+len(CARD_COLOURS)]   = bytes(self.cards[g, a].tolist())
+            buf[base+cs.RESERVED:base+cs.RESERVED+3]             = bytes(self.reserved[g, a].tolist())
+            buf[base+cs.OWN_NOBLES:base+cs.OWN_NOBLES+5]         = bytes(self.own_nobles[g, a].tolist())
+        return cs
+
+
+#Differential check against SplendorGameRule. Plays num_games random games in lockstep with the reference model,
+#asserting after every ply that both agree on the legal action set and on the resulting position. Returns plies played.
+def differential_check(num_games=32, num_agents=2, seed=0, max_plies=400):
+    rng   = random.Random(seed)
+    seeds = [rng.randrange(1<<32) for _ in range(num_games)]
+    env   = SplendorVectorEnv(num_games, num_agents).reset(seeds)
+    rule  = SplendorGameRule(num_agents)
+    games = []
+    for s in seeds:
+        random.seed(s)
+        games.append(SplendorState(num_agents))
+    plies = 0
+    for _ in range(max_plies):
+        mask = env.legal_mask()
+        done = env.done()
+        if done.all():
+            break
+        actions = np.full(num_games, -1)
+        for g,state in enumerate(games):
+            if done[g]:
+                continue
+            agent_id = state.agent_to_move
+            legal = rule.legal_action_ids(state, agent_id)
+            assert sorted(legal) == np.nonzero(mask[g])[0].tolist(), f'Legal actions differ in game {g}'
+            actions[g] = rng.choice(legal)
+            rule.generateSuccessor(state, rule.decode_action(actions[g], state, agent_id), agent_id)
+            plies += 1
+        env.step(actions)
+        for g,state in enumerate(games):
+            assert env.to_compact(g).buf == SplendorCompactState.from_state(state).buf, f'States differ in game {g}'
+    return plies
+
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+
+if __name__ == '__main__':
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    print(f'{differential_check(num_games)} plies matched SplendorGameRule.')
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,208 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Runs agents in persistent worker processes, held to deadlines by the engine.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import atexit, importlib, multiprocessing, struct, threading, time, traceback
+from   template import Agent
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+STARTUP_LIMIT = 15  #Time given to a worker to import its agent module and construct the agent.
+PONDER_LIMIT  = 1   #Time given to a worker to stop pondering, and to observe a move.
+
+#Message kinds. Requests: NEW (with an agent ID; construct a fresh agent), SELECT (choose an action), QUIT. Replies: READY, OK (followed
+#by the selected action, its position in the list sent if the agent returned one of those actions, or 0xFFFF if it
+#didn't, and the CPU seconds spent), ILLEGAL (the agent returned something that isn't an action) and
+#FAILED (the agent raised). Pondering requests: PONDER (with the game state; the agent ponders on a thread of the
+#worker), STOP (answered with READY once pondering has stopped) and OBSERVE (with the ID of the agent that moved, its
+#action and the resulting state; answered with READY).
+NEW, SELECT, QUIT, READY, OK, ILLEGAL, FAILED = b'N', b'S', b'Q', b'R', b'K', b'I', b'F'
+PONDER, STOP, OBSERVE = b'P', b'T', b'O'
+
+#Workers by (agent module, agent ID, model module), kept alive across games.
+WORKERS = {}
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+#Worker process main loop. A SELECT request holds the number of legal actions (2 bytes), the actions and then the game
+#state, in the model's binary encodings (action_to_bytes, state_to_bytes). The agent receives a decoded state, which
+#is its own to modify. Hidden information the encoding leaves out (e.g. deck order) can't be observed.
+def serve(conn, agent_module, model_name):
+    model = importlib.import_module(model_name)
+    agent_class = importlib.import_module(agent_module).myAgent
+    agent = None
+    size = model.ACTION_NBYTES
+    stop,pondering = threading.Event(),None
+    while True:
+        message = conn.recv_bytes()
+        kind = message[:1]
+        if kind == NEW:
+            agent = agent_class(message[1])
+            conn.send_bytes(READY)
+        elif kind == SELECT:
+            num_actions = int.from_bytes(message[1:3], 'little')
+            actions = [model.action_from_bytes(message, 3+k*size) for k in range(num_actions)]
+            state = model.state_from_bytes(message, 3+num_actions*size)
+            start = time.process_time()
+            try:
+                selected = agent.SelectAction(actions, state)
+            except Exception:
+                traceback.print_exc()
+                conn.send_bytes(FAILED)
+                continue
+            cpu = struct.pack('<d', time.process_time()-start)
+            index = next((k for k,action in enumerate(actions) if action is selected), 0xFFFF)
+            try:
+                conn.send_bytes(OK + bytes(model.action_to_bytes(selected)) + index.to_bytes(2, 'little') + cpu)
+            except Exception:
+                conn.send_bytes(ILLEGAL + cpu)
+        elif kind == PONDER:
+            stop.clear()
+            pondering = threading.Thread(target=agent.Ponder, args=(model.state_from_bytes(message, 1), stop), daemon=True)
+            pondering.start()
+        elif kind == STOP:
+            stop.set()
+            if pondering is not None:
+                pondering.join()
+            conn.send_bytes(READY)
+        elif kind == OBSERVE:
+            try:
+                agent.ObserveAction(message[1], model.action_from_bytes(message, 2), model.state_from_bytes(message, 2+size))
+            except Exception:
+                traceback.print_exc()
+            conn.send_bytes(READY)
+        elif kind == QUIT:
+            break
+
+@atexit.register
+def close_workers():
+    for worker in WORKERS.values():
+        worker.close()
+    WORKERS.clear()
+
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+#A worker process hosting one agent module. Processes are spawned rather than forked, such that each has its own
+#interpreter (and GIL), and none inherits the engine's state. A worker that misses a deadline is killed outright, so
+#it can't go on computing through later turns, and a replacement is started in its place.
+class AgentWorker:
+    def __init__(self, agent_module, agent_id, model_name):
+        self.args = (agent_module, agent_id, model_name)
+        self.start()
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=serve, args=(child_conn, self.args[0], self.args[2]), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    #Send a message and wait up to limit seconds (None for no limit) for the reply. Raises TimeoutError if none comes
+    #(after restarting the worker), and EOFError if the worker died.
+    def request(self, message, limit=None):
+        try:
+            self.conn.send_bytes(message)
+            if self.conn.poll(limit):
+                return self.conn.recv_bytes()
+        except (EOFError, OSError):
+            self.restart()
+            raise EOFError(f'Worker for {self.args[0]} exited')
+        self.restart()
+        raise TimeoutError(f'{self.args[0]} missed its {limit}s deadline')
+
+    #Construct a fresh agent in the worker.
+    def new_agent(self, limit=STARTUP_LIMIT):
+        if self.request(NEW + bytes([self.args[1]]), limit) != READY:
+            raise RuntimeError(f'Worker for {self.args[0]} failed to start')
+
+    def restart(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.start()
+
+    def close(self):
+        try:
+            self.conn.send_bytes(QUIT)
+        except (EOFError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+#Stand-in for an agent hosted by a worker process. The engine calls SelectAction with a time limit, which the worker is
+#held to in wall-clock time; the CPU time the agent spent on its last move is kept in cpu_time. Workers persist across
+#games: constructing a ProcessAgent reuses the worker for the same agent module, ID and model, but with a freshly
+#constructed agent.
+class ProcessAgent(Agent):
+    enforces_deadline = True
+    pool,worker_class,host = WORKERS,AgentWorker,'a worker process'
+
+    def __init__(self, _id, agent_module, model_name):
+        super().__init__(_id)
+        self.model = importlib.import_module(model_name)
+        self.agent_module = agent_module
+        self.cpu_time = None
+        key = (agent_module, _id, model_name)
+        try:
+            if key not in self.pool:
+                self.pool[key] = self.worker_class(*key)
+            self.worker = self.pool[key]
+            self.worker.new_agent()
+        except (EOFError, OSError, RuntimeError):
+            worker = self.pool.pop(key, None)
+            if worker is not None:
+                worker.close()
+            raise ImportError(f'Agent at "{agent_module}" could not be started in {self.host}')
+
+    #Returns the agent's action, or None if it returned something that isn't an action. An agent that returned one of
+    #the actions it was sent, unmodified, gets the caller's own object back. Raises TimeoutError if the agent misses
+    #time_limit, and RuntimeError if it raised.
+    def SelectAction(self, actions, game_state, time_limit=None):
+        model = self.model
+        message = bytearray(SELECT + len(actions).to_bytes(2, 'little'))
+        for action in actions:
+            message += model.action_to_bytes(action)
+        message += model.state_to_bytes(game_state)
+        try:
+            reply = self.worker.request(message, time_limit)
+        except EOFError:
+            self.worker.new_agent()
+            raise RuntimeError(f'Agent at "{self.agent_module}" exited')
+        except TimeoutError:
+            self.worker.new_agent()
+            raise
+        kind = reply[:1]
+        if kind == FAILED:
+            raise RuntimeError(f'Agent at "{self.agent_module}" raised an exception')
+        self.cpu_time = struct.unpack_from('<d', reply, len(reply)-8)[0]
+        if kind != OK:
+            return None
+        selected = model.action_from_bytes(reply, 1)
+        index = int.from_bytes(reply[1+model.ACTION_NBYTES:3+model.ACTION_NBYTES], 'little')
+        return actions[index] if index < len(actions) and actions[index] == selected else selected
+
+    #Pondering happens in the worker, in parallel with the engine and the agent to move. A worker that fails to stop
+    #pondering, or to observe the move, within PONDER_LIMIT is restarted with a fresh agent.
+    def Ponder(self, game_state, stop):
+        self.worker.conn.send_bytes(PONDER + self.model.state_to_bytes(game_state))
+        stop.wait()
+        self.request_or_restart(STOP)
+
+    def ObserveAction(self, agent_id, action, game_state):
+        self.request_or_restart(OBSERVE + bytes([agent_id]) + self.model.action_to_bytes(action)
+                                + self.model.state_to_bytes(game_state))
+
+    def request_or_restart(self, message):
+        try:
+            self.worker.request(message, PONDER_LIMIT)
+        except (EOFError, TimeoutError):
+            self.worker.new_agent()
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
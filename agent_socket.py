@@ -0,0 +1,99 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Serves agents over local sockets, and loads them into the runner by address.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import atexit, importlib, sys, threading
+from   multiprocessing.connection import Client, Listener
+from   optparse      import OptionParser
+from   agent_process import AgentWorker, ProcessAgent, serve, QUIT
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+PREFIX = 'socket:'  #Agents given to the runner as socket:ADDRESS are loaded from the agent server at ADDRESS.
+
+#Connections by (address, agent ID, model module), kept alive across games.
+CONNECTIONS = {}
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+#A (host, port) pair from "host:port", or else a Unix socket path.
+def parse_address(address):
+    host,_,port = address.rpartition(':')
+    return (host, int(port)) if host and port.isdigit() else address
+
+#Serve connections to an agent module until interrupted, each with its own agent, on its own thread. Messages are
+#those of agent_process.serve, framed with a 4-byte length prefix by multiprocessing.connection. The agent module is
+#imported before the first connection is accepted, such that its dependencies load once, and stay loaded across games.
+#An agent that misses a deadline is disconnected, but can't be killed: it computes on until it returns.
+def run_server(address, agent_module, model_name):
+    importlib.import_module(model_name)
+    importlib.import_module(agent_module)
+    with Listener(parse_address(address)) as listener:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=serve_connection, args=(conn, agent_module, model_name), daemon=True).start()
+
+def serve_connection(conn, agent_module, model_name):
+    try:
+        serve(conn, agent_module, model_name)
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+@atexit.register
+def close_connections():
+    for connection in CONNECTIONS.values():
+        connection.close()
+    CONNECTIONS.clear()
+
+def loadParameter():
+    parser = OptionParser(usage='python agent_socket.py -a agents.myteam.player [options]')
+    parser.add_option('-a','--agent', help='The agent module to serve, e.g. agents.myteam.player')
+    parser.add_option('-g','--game', help='The name of the game, starting with a uppercase character (default: Splendor)', default="Splendor")
+    parser.add_option('--address', help='Address to listen on, host:port or a Unix socket path (default: 127.0.0.1:6000)', default='127.0.0.1:6000')
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    assert options.agent, "An agent module is required (-a)"
+    return options
+
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+#A connection to an agent server, standing in for a worker process. Missing a deadline drops the connection, and a new
+#one is made in its place.
+class AgentConnection(AgentWorker):
+    def start(self):
+        self.conn = Client(parse_address(self.args[0]))
+
+    def restart(self):
+        self.conn.close()
+        self.start()
+
+    def close(self):
+        try:
+            self.conn.send_bytes(QUIT)
+        except (EOFError, OSError):
+            pass
+        self.conn.close()
+
+
+#Stand-in for an agent hosted by an agent server, loaded by the server's address. As for ProcessAgent, the engine
+#holds it to the time limit, and connections persist across games, with a freshly constructed agent per game.
+class SocketAgent(ProcessAgent):
+    pool,worker_class,host = CONNECTIONS,AgentConnection,'its agent server'
+
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+
+if __name__ == '__main__':
+    options = loadParameter()
+    model_name = f"{options.game}.{options.game.lower()}_model"
+    print(f'Serving {options.agent} at {options.address}.')
+    run_server(options.address, options.agent, model_name)
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
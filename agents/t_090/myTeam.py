@@ -1,6 +1,6 @@
 import numpy as np
 from template import Agent
-from Splendor.splendor_model import SplendorGameRule
+from Splendor.splendor_model import SplendorGameRule, is_terminal
 from math import log, sqrt
 import time
 import random
@@ -19,7 +19,7 @@ gem = {'red': 0, 'green': 0, 'blue': 0, 'black': 0, 'white': 0, 'yellow': 0}
 card = {'score': 0, 'red': 0, 'green': 0, 'blue': 0, 'black': 0, 'white': 0, 'yellow': 0}
 
 # Initialize game rule
-game_rule = SplendorGameRule(NUMBER_PLAYERS)
+game_rule = SplendorGameRule(NUMBER_PLAYERS, simulation=True, action_cache=True)
 
 # Monte Carlo Tree Search node class
 class MCTSNode:
@@ -281,7 +281,7 @@ class MCTS:
             game_state = deepcopy(self.game_state)
             
             # Selection and expansion phase
-            while not game_rule.gameEnds():
+            while not is_terminal(game_state):
                 # If the node is fully expanded, use UCB1 to select the best child
                 if not node.untried_actions and node.children:
                     node = node.SelectChild()
@@ -310,7 +310,7 @@ class MCTS:
         agent_id = self.agent_id
         simulation_depth = 1
         
-        while not game_rule.gameEnds() and simulation_depth < SIMULATION_DEPTH:
+        while not is_terminal(game_state) and simulation_depth < SIMULATION_DEPTH:
             # Break if reaching the time limit
             if time.time() - start_time > TIME_LIMIT:
                 break
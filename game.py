@@ -6,15 +6,32 @@
 
 # IMPORTS ------------------------------------------------------------------------------------------------------------#
 
-import random, copy, time
+import asyncio, inspect, random, copy, time, threading
 from   template     import GameState
 from   func_timeout import func_timeout, FunctionTimedOut
 from   template     import Agent as DummyAgent
+from   state_view   import ReadOnlyView, unwrap
+from   instrumentation import GameTimings, NoTimings
     
 # CONSTANTS ----------------------------------------------------------------------------------------------------------#
 
 FREEDOM = False  #Whether or not to penalise agents for incorrect moves and timeouts. Useful for debugging.
 WARMUP  = 15    #Warmup period (time given to each agent on their first turn).
+SNAPSHOT_INTERVAL = 16 #Plies between game snapshots kept in recorded replays, and by HeadlessReplayer.
+PONDER_GRACE = 1 #Time given to pondering agents to stop, and to observe the move that was made.
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+#Play AsyncGames concurrently on the running event loop, at most concurrency at a time (all at once by default).
+#Returns each game's history, in order. From synchronous code: asyncio.run(run_games(games)).
+async def run_games(games, concurrency=None):
+    if not concurrency:
+        return await asyncio.gather(*[game.Run() for game in games])
+    semaphore = asyncio.Semaphore(concurrency)
+    async def run(game):
+        async with semaphore:
+            return await game.Run()
+    return await asyncio.gather(*[run(game) for game in games])
 
 # CLASS DEF ----------------------------------------------------------------------------------------------------------#
 
@@ -27,11 +44,17 @@ class Game:
                  warning_limit=3, 
                  displayer = None, 
                  agents_namelist = ["Alice","Bob"],
-                 interactive=False):
+                 interactive=False,
+                 copy_states=False,
+                 instrument=False,
+                 snapshot_interval=None,
+                 ponder=False):
         
         self.seed = seed
-        random.seed(self.seed)
-        self.seed_list = [random.randint(0,1e10) for _ in range(1000)]
+        #The engine draws (the initial state, deals, and moves made for agents after warnings) from its own stream,
+        #such that games reproduce from their seed however agents, or other games, use the global random module.
+        self.rng = random.Random(self.seed)
+        self.seed_list = [self.rng.randint(0,1e10) for _ in range(1000)]
         self.seed_idx = 0
 
         # Make sure we are forming a valid game, and that agent
@@ -43,7 +66,9 @@ class Game:
             assert(plyr.id == i)    
             i += 1
 
-        self.game_rule = GameRule(num_of_agent)
+        self.game_rule = GameRule(num_of_agent, rng=self.rng)
+        #Agents get the global random module in the state it would be in had the engine drawn from it.
+        random.setstate(self.rng.getstate())
         self.gamemaster = DummyAgent(num_of_agent) #GM/template agent used by some games (e.g. Azul, for signalling rounds).
 
         # need to handle the same without needed a validAction function
@@ -63,6 +88,23 @@ class Game:
         if self.displayer is not None:
             self.displayer.InitDisplayer(self)
         self.interactive = interactive
+        #Agents are handed read-only views of the game state and legal actions, rather than deep copies of them. Set
+        #copy_states for agents that aren't trusted with views (e.g. that may write to objects behind a view through
+        #module internals), in which case every turn pays for deep copies again.
+        self.copy_states = copy_states
+        #If instrumenting, each phase of every turn is timed, along with agents' think times, and calls to the game
+        #rule's instrumented_calls are counted. A summary is returned in the history, under "timings".
+        self.timings = GameTimings() if instrument else NoTimings()
+        #If given an interval, a snapshot of the game (see GameRule.snapshotState) is taken every snapshot_interval
+        #plies, and returned in the history under "snapshots", by ply, such that HeadlessReplayer can seek in the replay
+        #of this game without replaying from the first move.
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = {}
+        #If pondering, agents waiting on another agent's move may think in the background (see template.Agent.Ponder).
+        self.ponder = ponder
+        self.ponder_threads = {}
+        if instrument:
+            self.timings.count_calls(self.game_rule, self.game_rule.instrumented_calls)
 
     def _EndGame(self,num_of_agent,history, isTimeOut = True, id = None):
         history.update({"seed":self.seed,
@@ -70,6 +112,10 @@ class Game:
                         "agents_namelist":self.agents_namelist,
                         "warning_positions":self.warning_positions,
                         "warning_limit":self.warning_limit})
+        if isinstance(self.timings, GameTimings):
+            history["timings"] = self.timings.summary()
+        if self.snapshot_interval:
+            history["snapshots"] = self.snapshots
         history["scores"]= {i:0 for i in range(num_of_agent)}
         if isTimeOut:
             history["scores"][id] = -1
@@ -81,34 +127,205 @@ class Game:
             self.displayer.EndGame(self.game_rule.current_game_state,history["scores"])
         return history
 
+    #The game state and legal actions as handed to an agent. Views raise on any write, so the engine's own state and
+    #actions can be shared with the agent. Games with private information still need copies, from which unobservable
+    #attributes are deleted, as do agents reading the state while the engine may change it (detached).
+    def _AgentCopies(self, game_state, actions, agent_index, detached=False):
+        if detached or self.copy_states or self.game_rule.private_information:
+            actions_copy = copy.deepcopy(actions)
+            gs_copy = copy.deepcopy(game_state)
+        else:
+            actions_copy = [ReadOnlyView(action) for action in actions]
+            gs_copy = ReadOnlyView(game_state)
+        
+        # Delete all specified attributes in the agent state copies, if this isn't a perfect information game.
+        if self.game_rule.private_information:
+            delattr(gs_copy.deck, 'cards') # Upcoming cards cannot be observed.
+            for i in range(len(gs_copy.agents)):
+                if gs_copy.agents[i].id != agent_index:
+                    for attr in self.game_rule.private_information:
+                        delattr(gs_copy.agents[i], attr)
+        return gs_copy, actions_copy
+
+    #Start each agent that ponders, other than the one to move, pondering on its own thread, with its own copy of the
+    #state. Pondering happens outside of any agent's time limit. Agents in worker processes (see agent_process.py)
+    #ponder in their own process, and so in parallel with the agent to move; agents in the engine's process share its
+    #GIL with the agent to move. An agent still pondering from an earlier turn (see _StopPondering) is left to finish.
+    def _StartPondering(self, game_state, agent_index):
+        pondering = []
+        if agent_index >= len(self.agents):
+            return pondering
+        for agent in self.agents:
+            if agent.id != agent_index and type(agent).Ponder is not DummyAgent.Ponder:
+                previous = self.ponder_threads.get(agent.id)
+                if previous is not None and previous.is_alive():
+                    continue
+                stop = threading.Event()
+                gs_copy,_ = self._AgentCopies(game_state, [], agent.id, detached=True)
+                thread = threading.Thread(target=self._Ponder, args=(agent, gs_copy, stop), daemon=True)
+                thread.start()
+                self.ponder_threads[agent.id] = thread
+                pondering.append((agent, stop, thread))
+        return pondering
+
+    def _Ponder(self, agent, game_state, stop):
+        try:
+            agent.Ponder(game_state, stop)
+        except Exception:
+            pass
+
+    #Cancel pondering, before the move is applied. Agents are given PONDER_GRACE seconds to stop. One that overruns is
+    #left behind, but not penalised, since pondering is outside of timeout accounting; it observes no moves, and starts
+    #pondering no more, until its thread has returned. Agents that enforce their own deadlines are trusted to keep to
+    #PONDER_GRACE themselves.
+    def _StopPondering(self, pondering):
+        for _,stop,_ in pondering:
+            stop.set()
+        for agent,_,thread in pondering:
+            thread.join(None if getattr(agent, 'enforces_deadline', False) else PONDER_GRACE)
+
+    #Deliver the move that was made, and the state it led to, to every agent that pondered and has stopped. Agents are
+    #given PONDER_GRACE seconds to observe the move.
+    def _ObserveMove(self, pondering, agent_index, selected):
+        game_state = self.game_rule.current_game_state
+        for agent,_,thread in pondering:
+            if thread.is_alive():
+                continue
+            gs_copy,_ = self._AgentCopies(game_state, [], agent.id)
+            try:
+                if getattr(agent, 'enforces_deadline', False):
+                    agent.ObserveAction(agent_index, selected, gs_copy)
+                else:
+                    func_timeout(PONDER_GRACE, agent.ObserveAction, args=(agent_index, selected, gs_copy))
+            except:
+                pass
+
+    #The legal action an agent selected, or None if its selection isn't legal. Agents handed read-only views (and worker
+    #processes, see agent_process.py) return the engine's own action objects, which are matched by identity alone, at
+    #the cost of a pointer comparison per action. Other selections are then looked for by equality, under which cards
+    #must also carry their genuine points (see Card.__eq__).
+    def _LegalAction(self, selected, actions):
+        target = unwrap(selected)
+        for action in actions:
+            if action is target:
+                return action
+        for action in actions:
+            if action == target:
+                return action
+        return None
+
+    #Set up the next turn: the agent to move, the legal actions, and the copies of both handed to agents. Returns
+    #(agent_index, agent, game_state, actions, gs_copy, actions_copy, pondering).
+    def _StartTurn(self, action_counter):
+        timings = self.timings
+        agent_index = self.game_rule.getCurrentAgentIndex()
+        agent = self.agents[agent_index] if agent_index < len(self.agents) else self.gamemaster
+        game_state = self.game_rule.current_game_state
+        game_state.agent_to_move = agent_index
+        if self.snapshot_interval and action_counter % self.snapshot_interval == 0:
+            self.snapshots[action_counter] = self.game_rule.snapshotState()
+        with timings.phase("legal_actions"):
+            actions = self.game_rule.getLegalActions(game_state, agent_index)
+        with timings.phase("copy"):
+            gs_copy,actions_copy = self._AgentCopies(game_state, actions, agent_index)
+            #Only read-only views are shared: an agent may write to its own deep copies.
+            if not (self.copy_states or self.game_rule.private_information):
+                self.game_rule.shareLegalActions(gs_copy, agent_index, actions_copy)
+        pondering = self._StartPondering(game_state, agent_index) if self.ponder else []
+        
+        #Before updating the game, if this is the first move, allow the displayer an initial update.
+        #This is used by some games to run simple pre-game animations.
+        if action_counter==0 and self.displayer is not None:
+            with timings.phase("display"):
+                self.displayer._DisplayState(self.game_rule.current_game_state)
+        return agent_index, agent, game_state, actions, gs_copy, actions_copy, pondering
+
+    #Validate an action selected within a time limit (or "timeout"), penalising timeouts and illegal moves.
+    #"Gamemaster" agent has an agent index equal to the number of player agents in the game.
+    #If the gamemaster acts (e.g. to start or end a round in Azul), let it do so uninhibited.
+    #- If it times out, display TimeOutWarning. 
+    #- If it returns an illegal move, display IllegalWarning.
+    #  - Illegal move checked by self.validaction(), if implemented by the game being run.
+    #  - Else, look for move in actions list (see _LegalAction), and take the engine's own copy of it.
+    def _CheckSelection(self, turn, selected, action_counter):
+        agent_index,_,_,actions,_,_,_ = turn
+        timings = self.timings
+        if agent_index != self.game_rule.num_of_agent:
+            if selected != "timeout":
+                with timings.phase("validate"):
+                    if self.valid_action:
+                        if not self.valid_action(selected, actions):
+                            selected = "illegal"
+                    else:
+                        selected = self._LegalAction(selected, actions)
+                        if selected is None:
+                            selected = "illegal"
+                
+            if selected in ["timeout", "illegal"]:
+                self.warnings[agent_index] += 1
+                self.warning_positions.append((agent_index,action_counter))
+                if self.displayer is not None:
+                    with timings.phase("display"):
+                        if selected=="timeout":
+                            self.displayer.TimeOutWarning(self,agent_index)
+                        else:
+                            self.displayer.IllegalWarning(self,agent_index)                        
+                selected = self.rng.choice(actions)
+        return selected
+
+    #Record and apply the selected action, returning it as applied. The rule's stream is reseeded from the seed list
+    #for the update, and the global random module after it, such that agents' own draws are reproducible from the game
+    #seed when games are run one at a time.
+    def _ApplySelection(self, selected, history, action_counter):
+        #Actions picked from views are recorded and applied as the plain actions behind them.
+        selected = unwrap(selected)
+        self.rng.seed(self.seed_list[self.seed_idx])
+        self.seed_idx += 1
+        history["actions"].append({action_counter:{"agent_id":self.game_rule.current_agent_index,"action":selected}})
+        
+        with self.timings.phase("update"):
+            self.game_rule.update(selected)
+        random.seed(self.seed_list[self.seed_idx])
+        self.seed_idx += 1
+        return selected
+
+    #Display the move made. Returns the finished history if the agent has run out of warnings.
+    def _EndTurn(self, turn, selected, history):
+        agent_index = turn[0]
+        if self.displayer is not None:
+            with self.timings.phase("display"):
+                self.displayer.ExcuteAction(agent_index,selected, self.game_rule.current_game_state)
+
+        if (agent_index != self.game_rule.num_of_agent) and (self.warnings[agent_index] == self.warning_limit):
+            return self._EndGame(self.game_rule.num_of_agent,history,isTimeOut=True,id=agent_index)
+        return None
+
+    #Have the agent select an action within limit seconds. Returns the action (or "timeout") and the time taken.
+    #Agents that enforce their own deadlines (e.g. those hosted in worker processes, which encode the state rather than
+    #share it) are given the time limit, instead of a timeout thread.
+    def _TimedSelect(self, turn, limit):
+        _,agent,game_state,actions,gs_copy,actions_copy,_ = turn
+        start = time.perf_counter()
+        try: 
+            if getattr(agent, 'enforces_deadline', False):
+                selected = agent.SelectAction(actions, game_state, limit)
+            else:
+                selected = func_timeout(limit, agent.SelectAction,args=(actions_copy, gs_copy))
+        except:
+            selected = "timeout"
+        return selected, time.perf_counter()-start
+
     def Run(self):
         history = {"actions":[]}
         action_counter = 0
         while not self.game_rule.gameEnds():
-            agent_index = self.game_rule.getCurrentAgentIndex()
-            agent = self.agents[agent_index] if agent_index < len(self.agents) else self.gamemaster
-            game_state = self.game_rule.current_game_state
-            game_state.agent_to_move = agent_index
-            actions = self.game_rule.getLegalActions(game_state, agent_index)
-            actions_copy = copy.deepcopy(actions)
-            gs_copy = copy.deepcopy(game_state)
-            
-            # Delete all specified attributes in the agent state copies, if this isn't a perfect information game.
-            if self.game_rule.private_information:
-                delattr(gs_copy.deck, 'cards') # Upcoming cards cannot be observed.
-                for i in range(len(gs_copy.agents)):
-                    if gs_copy.agents[i].id != agent_index:
-                        for attr in self.game_rule.private_information:
-                            delattr(gs_copy.agents[i], attr)
-            
-            #Before updating the game, if this is the first move, allow the displayer an initial update.
-            #This is used by some games to run simple pre-game animations.
-            if action_counter==0 and self.displayer is not None:
-                self.displayer._DisplayState(self.game_rule.current_game_state)
+            turn = self._StartTurn(action_counter)
+            agent_index,agent,_,_,gs_copy,actions_copy,pondering = turn
                         
             #If interactive mode, update displayer and obtain action via user input.
             if self.interactive and agent_index==1:
-                self.displayer._DisplayState(self.game_rule.current_game_state)
+                with self.timings.phase("display"):
+                    self.displayer._DisplayState(self.game_rule.current_game_state)
                 selected = self.displayer.user_input(actions_copy)
                 
             else:
@@ -117,66 +334,91 @@ class Game:
                 if FREEDOM:
                     selected = agent.SelectAction(actions_copy, gs_copy)
                 else:
-                    #"Gamemaster" agent has an agent index equal to the number of player agents in the game.
-                    #If the gamemaster acts (e.g. to start or end a round in Azul), let it do so uninhibited.
-                    #Else, allow player agent to select action within a time limit. 
-                    #- If it times out, display TimeOutWarning. 
-                    #- If it returns an illegal move, display IllegalWarning.
-                    #  - Illegal move checked by self.validaction(), if implemented by the game being run.
-                    #  - Else, look for move in actions list by equality according to Python.
+                    #Allow player agent to select action within a time limit (see _CheckSelection).
                     #If this is the agent's first turn, allow warmup time.
-                    try: 
-                        selected = func_timeout(WARMUP if action_counter < len(self.agents) else self.time_limit, 
-                                                agent.SelectAction,args=(actions_copy, gs_copy))
-                    except:
-                        selected = "timeout"
-                        
-                    if agent_index != self.game_rule.num_of_agent:
-                        if selected != "timeout":
-                            if self.valid_action:
-                                if not self.valid_action(selected, actions):
-                                    selected = "illegal"
-                            elif not selected in actions:
-                                selected = "illegal"
-                            
-                        if selected in ["timeout", "illegal"]:
-                            self.warnings[agent_index] += 1
-                            self.warning_positions.append((agent_index,action_counter))
-                            if self.displayer is not None:
-                                if selected=="timeout":
-                                    self.displayer.TimeOutWarning(self,agent_index)
-                                else:
-                                    self.displayer.IllegalWarning(self,agent_index)                        
-                            selected = random.choice(actions)
+                    limit = WARMUP if action_counter < len(self.agents) else self.time_limit
+                    selected,seconds = self._TimedSelect(turn, limit)
+                    self.timings.think(agent_index, action_counter, seconds, limit)
+                    selected = self._CheckSelection(turn, selected, action_counter)
 
-                
-            random.seed(self.seed_list[self.seed_idx])
-            self.seed_idx += 1
-            history["actions"].append({action_counter:{"agent_id":self.game_rule.current_agent_index,"action":selected}})
+            if pondering:
+                with self.timings.phase("ponder_stop"):
+                    self._StopPondering(pondering)
+            selected = self._ApplySelection(selected, history, action_counter)
+            if pondering:
+                with self.timings.phase("observe"):
+                    self._ObserveMove(pondering, agent_index, selected)
+            ended = self._EndTurn(turn, selected, history)
             action_counter += 1
-            
-            self.game_rule.update(selected)
-            random.seed(self.seed_list[self.seed_idx])
-            self.seed_idx += 1
-
-            if self.displayer is not None:
-                self.displayer.ExcuteAction(agent_index,selected, self.game_rule.current_game_state)
-
-            if (agent_index != self.game_rule.num_of_agent) and (self.warnings[agent_index] == self.warning_limit):
-                history = self._EndGame(self.game_rule.num_of_agent,history,isTimeOut=True,id=agent_index)
-                return history
+            if ended is not None:
+                return ended
                 
         # Score agent bonuses
         return self._EndGame(self.game_rule.num_of_agent,history,isTimeOut=False)
             
 
+#A Game played as a coroutine, such that many games can share one event loop (see run_games). Agents whose
+#SelectAction is a coroutine function are awaited on the loop, under asyncio.wait_for, and should await rather than
+#block while they think; other agents are run on the loop's default executor, timed as in Game. The rest of a turn is
+#Game's own. The engine draws only from the game's own stream, so replays reproduce however games interleave; agents'
+#own draws from the global random module are not reproducible across interleavings. Displayers and interactive play
+#block the loop while they run; they are meant for single games.
+class AsyncGame(Game):
+    async def _TimedSelectAsync(self, turn, limit):
+        _,agent,_,_,gs_copy,actions_copy,_ = turn
+        if not inspect.iscoroutinefunction(agent.SelectAction):
+            return await asyncio.get_running_loop().run_in_executor(None, self._TimedSelect, turn, limit)
+        start = time.perf_counter()
+        try:
+            selected = await asyncio.wait_for(agent.SelectAction(actions_copy, gs_copy), limit)
+        except Exception:
+            selected = "timeout"
+        return selected, time.perf_counter()-start
+
+    async def Run(self):
+        history = {"actions":[]}
+        action_counter = 0
+        while not self.game_rule.gameEnds():
+            turn = self._StartTurn(action_counter)
+            agent_index,agent,_,_,gs_copy,actions_copy,pondering = turn
+            
+            if self.interactive and agent_index==1:
+                with self.timings.phase("display"):
+                    self.displayer._DisplayState(self.game_rule.current_game_state)
+                selected = self.displayer.user_input(actions_copy)
+            elif FREEDOM:
+                selected = agent.SelectAction(actions_copy, gs_copy)
+                if inspect.isawaitable(selected):
+                    selected = await selected
+            else:
+                limit = WARMUP if action_counter < len(self.agents) else self.time_limit
+                selected,seconds = await self._TimedSelectAsync(turn, limit)
+                self.timings.think(agent_index, action_counter, seconds, limit)
+                selected = self._CheckSelection(turn, selected, action_counter)
+
+            if pondering:
+                with self.timings.phase("ponder_stop"):
+                    await asyncio.get_running_loop().run_in_executor(None, self._StopPondering, pondering)
+            selected = self._ApplySelection(selected, history, action_counter)
+            if pondering:
+                with self.timings.phase("observe"):
+                    await asyncio.get_running_loop().run_in_executor(None, self._ObserveMove,
+                                                                     pondering, agent_index, selected)
+            ended = self._EndTurn(turn, selected, history)
+            action_counter += 1
+            if ended is not None:
+                return ended
+        
+        return self._EndGame(self.game_rule.num_of_agent,history,isTimeOut=False)
+
+
 class GameReplayer:
     def __init__(self,GameRule,replay, displayer = None):
         self.replay = replay
                     
         self.seed = self.replay["seed"]
-        random.seed(self.seed)
-        self.seed_list = [random.randint(0,1e10) for _ in range(1000)]
+        self.rng = random.Random(self.seed)
+        self.seed_list = [self.rng.randint(0,1e10) for _ in range(1000)]
         self.seed_idx = 0
 
         self.num_of_agent = self.replay["num_of_agent"]
@@ -184,7 +426,7 @@ class GameReplayer:
         self.warning_limit = replay["warning_limit"]
         self.warnings = [0]*self.num_of_agent
         self.warning_positions = replay["warning_positions"]
-        self.game_rule = GameRule(self.num_of_agent)
+        self.game_rule = GameRule(self.num_of_agent, rng=self.rng)
         self.scores=replay["scores"]
 
         self.displayer = displayer
@@ -198,11 +440,9 @@ class GameReplayer:
             agent_index = info["agent_id"]
             self.game_rule.current_agent_index = agent_index          
 
-            random.seed(self.seed_list[self.seed_idx])
-            self.seed_idx += 1
+            self.rng.seed(self.seed_list[self.seed_idx])
             self.game_rule.update(selected)
-            random.seed(self.seed_list[self.seed_idx])
-            self.seed_idx += 1
+            self.seed_idx += 2
             if self.displayer is not None:
                 if (agent_index,index) in self.warning_positions:
                     self.warnings[agent_index] += 1
@@ -212,3 +452,58 @@ class GameReplayer:
         if self.displayer is not None:
             self.displayer.EndGame(self.game_rule.current_game_state,self.scores)
    
+
+
+#Replays a recorded game without a displayer. Seeks start from the snapshots recorded in the replay, if any (or passed
+#in), and every `interval` plies a further snapshot is kept, such that state_at(ply) replays at most interval-1 moves
+#from the nearest snapshot, and states() streams the game lazily. Snapshots are in the game's own encoding (see
+#GameRule.snapshotState), which may leave out history: states sought from them only hold what the encoding does.
+#Moves are applied exactly as recorded: before each, the rule's stream is seeded from the game's seed list, as Game.Run
+#did. The reseed Game.Run makes after each move only affects agents, and is skipped, and nothing is displayed.
+class HeadlessReplayer:
+    def __init__(self, GameRule, replay, interval=SNAPSHOT_INTERVAL, snapshots=None):
+        self.GameRule = GameRule
+        self.num_of_agent = replay["num_of_agent"]
+        self.interval = interval
+        self.actions = [(info["agent_id"], info["action"]) for item in replay["actions"] for info in item.values()]
+        #The initial state is drawn from the game's stream once the seed list has been, as in Game.__init__.
+        self.rng = random.Random(replay["seed"])
+        self.seed_list = [self.rng.randint(0,1e10) for _ in range(1000)]
+        self.snapshots = {0: GameRule(self.num_of_agent, rng=self.rng).snapshotState()}
+        self.snapshots.update(replay.get("snapshots") or {})
+        self.snapshots.update(snapshots or {})
+
+    def __len__(self):
+        return len(self.actions)
+
+    def _Step(self, game_rule, ply):
+        agent_index,selected = self.actions[ply]
+        game_rule.current_agent_index = agent_index
+        self.rng.seed(self.seed_list[2*ply])
+        game_rule.update(selected)
+        if (ply+1) % self.interval == 0 and ply+1 not in self.snapshots:
+            self.snapshots[ply+1] = game_rule.snapshotState()
+
+    #A game rule restored to the latest snapshot at or before ply, and that snapshot's ply.
+    def _Seek(self, ply):
+        start = max(p for p in self.snapshots if p <= ply)
+        return self.GameRule(self.num_of_agent, rng=self.rng).restoreState(self.snapshots[start]), start
+
+    #The game state after ply moves (0 for the initial state, len(self) for the final state), as a new object.
+    def state_at(self, ply):
+        if not 0 <= ply <= len(self.actions):
+            raise IndexError(f'ply {ply} is outside a game of {len(self.actions)} moves')
+        game_rule,start = self._Seek(ply)
+        for p in range(start, ply):
+            self._Step(game_rule, p)
+        return game_rule.current_game_state
+
+    #Yield (ply, state, action) for each move from ply start onwards, where state is the game state the action was
+    #taken in. The state is live, and is advanced by the next step: copy it to keep it.
+    def states(self, start=0):
+        game_rule,ply = self._Seek(start)
+        for p in range(ply, start):
+            self._Step(game_rule, p)
+        for p in range(start, len(self.actions)):
+            yield p, game_rule.current_game_state, self.actions[p][1]
+            self._Step(game_rule, p)
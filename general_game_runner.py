@@ -23,7 +23,9 @@ import random
 import pytz
 import json
 from template import Agent as DummyAgent
-from game import Game, GameReplayer
+from game import Game, GameReplayer, SNAPSHOT_INTERVAL
+from agent_process import ProcessAgent
+from agent_socket  import SocketAgent, PREFIX as SOCKET_PREFIX
 from optparse import OptionParser
 
 
@@ -45,7 +47,31 @@ DATE_FORMAT = '%d/%m/%Y %H:%M:%S'  # RMIT Uni (Australia)
 
 
 
-def loadAgent(matches,superQuiet = True):
+#If the game's model provides a binary action encoding (action_to_bytes/action_from_bytes), replays store actions in
+#it rather than as pickled dicts. Decoding leaves actions that are not bytes as they are, so older replays still load.
+def encodeReplay(replay, model):
+    encode = getattr(model, 'action_to_bytes', None)
+    if encode is None:
+        return replay
+    replay = dict(replay)
+    replay["actions"] = [{index:dict(info, action=bytes(encode(info["action"])))}
+                         for item in replay["actions"] for index,info in item.items()]
+    return replay
+
+def decodeReplay(replay, model):
+    decode = getattr(model, 'action_from_bytes', None)
+    if decode is None:
+        return replay
+    for item in replay["actions"]:
+        for info in item.values():
+            if isinstance(info["action"], bytes):
+                info["action"] = decode(info["action"])
+    return replay
+
+# Agents given as socket:ADDRESS are loaded from the agent server at that address (see agent_socket.py). If processes is
+# set, each other agent is hosted in a persistent worker process (see agent_process.py). Both exchange states and actions
+# with the engine in the binary encoding of the model model_name.
+def loadAgent(matches,superQuiet = True,model_name = None,processes = False):
     teams = matches['teams']
     num_of_agents = len(teams)
     agents = [None]*num_of_agents
@@ -53,8 +79,13 @@ def loadAgent(matches,superQuiet = True):
     for i in range(num_of_agents):
         agent_temp = None
         try:
-            mymodule = importlib.import_module(teams[i]['agent'])
-            agent_temp = mymodule.myAgent(i)
+            if teams[i]['agent'].startswith(SOCKET_PREFIX):
+                agent_temp = SocketAgent(i, teams[i]['agent'][len(SOCKET_PREFIX):], model_name)
+            elif processes:
+                agent_temp = ProcessAgent(i, teams[i]['agent'], model_name)
+            else:
+                mymodule = importlib.import_module(teams[i]['agent'])
+                agent_temp = mymodule.myAgent(i)
         except (NameError, ImportError, IOError):
             print('Error: Agent at "' + teams[i]['agent'] + '" could not be loaded!', file=sys.stderr)
             traceback.print_exc()
@@ -173,14 +204,15 @@ def run(options,msg):
         if not options.superQuiet:
             print('Replaying recorded game %s.' % options.replay)
         replay_dir = options.replay
-        replay = pickle.load(open(replay_dir,'rb'),encoding="bytes")
+        replay = decodeReplay(pickle.load(open(replay_dir,'rb'),encoding="bytes"), model)
         GameReplayer(GameRule,replay,displayer).Run()
     else: 
         games_results = [tuple([0]*num_of_agents for i in range(5))]
         # results = {"succ":valid_game}
         for game_num in range(options.multipleGames):
             game = {}
-            loaded_agents, valid_game = loadAgent(matches, superQuiet=options.superQuiet)
+            loaded_agents, valid_game = loadAgent(matches, superQuiet=options.superQuiet,
+                                                  model_name=model.__name__, processes=options.agentProcesses)
 
             game.update({'valid_game':valid_game})
             random_seed=seed_list[seed_idx]
@@ -201,7 +233,11 @@ def run(options,msg):
                         warning_limit=num_of_warning,
                         displayer=displayer,
                         agents_namelist=agent_names,
-                        interactive=options.interactive)
+                        interactive=options.interactive,
+                        copy_states=options.copyStates,
+                        instrument=options.instrument,
+                        ponder=options.ponder,
+                        snapshot_interval=SNAPSHOT_INTERVAL if options.saveGameRecord else None)
             if not options.print:
                 with HidePrint(options.saveLog,file_path,f_name):
                     print("Following are the print info for loading:\n{}\n".format(msg))
@@ -230,6 +266,8 @@ def run(options,msg):
                 new_ties  = []
                 new_loses = []
                 game.update({f"scores":replay["scores"]})
+                if "timings" in replay:
+                    game.update({"timings":replay["timings"]})
                 
                 #Record scores.
                 for i in range(num_of_agents):
@@ -278,7 +316,7 @@ def run(options,msg):
                         os.makedirs(file_path)
                     if not options.superQuiet:
                         print("Game ({}/{}) has been recorded!".format(game_num+1,options.multipleGames))
-                    record = pickle.dumps(replay)
+                    record = pickle.dumps(encodeReplay(replay, model))
                     game.update({'replay_path': f"{file_path}/replay-{f_name}.replay"})
                     with open(f"{file_path}/replay-{f_name}.replay",'wb') as f:
                         f.write(record)
@@ -326,7 +364,7 @@ def loadParameter():
     """
     parser = OptionParser(usageStr)
 
-    parser.add_option('-a','--agents', help='A list of the agents, etc, agents.myteam.player', default="agents.generic.random,agents.generic.random") 
+    parser.add_option('-a','--agents', help='A list of the agents, etc, agents.myteam.player, or socket:host:port for an agent server (see agent_socket.py)', default="agents.generic.random,agents.generic.random") 
     parser.add_option('--agent_names', help='A list of agent names', default="random0,random1") 
 
     parser.add_option('-n', '--num_of_agents', type='int',help='The number of agents in this game', default=2)
@@ -347,6 +385,10 @@ def loadParameter():
     parser.add_option('--delay', type='float', help='Delay action in a play or replay by input (float) seconds (default 0.1)', default=0.1)
     parser.add_option('-p','--print', action='store_true', help='Print all the output in terminal when playing games, will diable \'-l\' automatically. (default: False)', default=False)
     parser.add_option('--half-scale', action='store_true', help='Display game at half-scale (default is 1920x1080)', default=False)
+    parser.add_option('--agentProcesses', action='store_true', help='Run each agent in a persistent worker process, held to the time limit by the engine (default: False)', default=False)
+    parser.add_option('--ponder', action='store_true', help='Let agents ponder while other agents choose their moves (default: False)', default=False)
+    parser.add_option('--instrument', action='store_true', help='Record per-turn timings and call counts in game histories and matches.json (default: False)', default=False)
+    parser.add_option('--copyStates', action='store_true', help='Hand agents deep copies of the game state and actions, rather than read-only views (default: False)', default=False)
     parser.add_option('--interactive', action='store_true', help="Gives the user control over the Citrine agent's actions", default=False)   
 
     options, otherjunk = parser.parse_args(sys.argv[1:] )
@@ -0,0 +1,98 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Opt-in per-turn timings and call counters for the game engine, summarised per game.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import time
+from   collections import Counter, defaultdict
+from   contextlib  import nullcontext
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+#Histogram bucket upper edges, in seconds. A final bucket counts everything slower than the last edge.
+HISTOGRAM_EDGES = [1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1, 10]
+NEAR_TIMEOUT    = 0.8  #Think times over this fraction of the time limit are listed in the summary as near timeouts.
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+#Nearest-rank percentile of a sorted list.
+def percentile(ordered, p):
+    return ordered[min(len(ordered)-1, max(0, -(-len(ordered)*p//100) - 1))]
+
+#Count, total, mean, p50/p95/p99, max and histogram of a list of durations in seconds.
+def summarise(samples):
+    ordered = sorted(samples)
+    counts  = [0]*(len(HISTOGRAM_EDGES)+1)
+    for t in ordered:
+        counts[next((k for k,edge in enumerate(HISTOGRAM_EDGES) if t<=edge), len(HISTOGRAM_EDGES))] += 1
+    return {'n':len(ordered), 'total':sum(ordered), 'mean':sum(ordered)/len(ordered) if ordered else 0,
+            'p50':percentile(ordered, 50) if ordered else 0, 'p95':percentile(ordered, 95) if ordered else 0,
+            'p99':percentile(ordered, 99) if ordered else 0, 'max':ordered[-1] if ordered else 0,
+            'histogram':{'edges':HISTOGRAM_EDGES, 'counts':counts}}
+
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+class Phase:
+    __slots__ = ('samples', 'start')
+    def __init__(self, samples):
+        self.samples = samples
+    def __enter__(self):
+        self.start = time.perf_counter()
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+
+
+#Timings of one game. Game.Run times each phase of a turn with `with timings.phase(name):`, and each agent's think time
+#with think(). Calls to selected methods of an object (e.g. a game rule's instrumented_calls) are counted by wrapping
+#them on the instance, so that other instances of its class are unaffected, and nothing is wrapped unless asked for.
+class GameTimings:
+    def __init__(self):
+        self.phases = {}
+        self.thinking = defaultdict(list)
+        self.limits = {}
+        self.near_timeouts = []
+        self.calls = Counter()
+
+    def phase(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase([])
+        return phase
+
+    def think(self, agent_id, ply, seconds, limit):
+        self.thinking[agent_id].append(seconds)
+        self.limits[agent_id] = max(self.limits.get(agent_id, 0), seconds/limit)
+        if seconds > NEAR_TIMEOUT*limit:
+            self.near_timeouts.append((agent_id, ply, seconds))
+
+    def count_calls(self, obj, names):
+        for name in names:
+            method = getattr(obj, name)
+            def counted(*args, _method=method, _name=name, **kwargs):
+                self.calls[_name] += 1
+                return _method(*args, **kwargs)
+            setattr(obj, name, counted)
+
+    #Structured summary of the game, built from plain types such that it can go in replays and matches.json.
+    def summary(self):
+        think = {}
+        for agent_id,samples in sorted(self.thinking.items()):
+            think[agent_id] = summarise(samples)
+            think[agent_id]['max_limit_fraction'] = self.limits[agent_id]
+        return {'phases':{name:summarise(phase.samples) for name,phase in self.phases.items()},
+                'think':think,
+                'near_timeouts':[list(entry) for entry in self.near_timeouts],
+                'calls':dict(self.calls)}
+
+
+#Stand-in for GameTimings when instrumentation is off, at the cost of a method call per phase.
+class NoTimings:
+    def phase(self, name):
+        return nullcontext()
+    def think(self, agent_id, ply, seconds, limit):
+        pass
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
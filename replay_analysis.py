@@ -0,0 +1,151 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Replays directories of recorded games headlessly, in parallel, into columnar per-game and per-ply tables.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import glob, importlib, os, pickle, sys, traceback
+import numpy as np
+from   concurrent.futures  import ProcessPoolExecutor
+from   optparse            import OptionParser
+from   game                import HeadlessReplayer
+from   general_game_runner import decodeReplay
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+MAX_AGENTS = 4    #Per-agent game columns are padded to this many agents, with -1.
+BATCH_SIZE = 256  #Replays per part file.
+
+#Columns of each table, with their dtypes. Per game: replay file name, seed, number of agents and of plies, final
+#scores (as recorded, including any tie-break half point), warnings per agent, and the ply of the first noble visit (-1
+#if none). Per ply: the game's row in the games table of the same part, ply, agent, action type, whether a noble visits,
+#the agent's points before the move, and whether the move was made for the agent after a warning (a timeout or illegal
+#move).
+GAME_COLUMNS = {'replay':str, 'seed':np.int64, 'num_agents':np.int8, 'plies':np.int32, 'scores':np.float32,
+                'warnings':np.int16, 'first_noble_ply':np.int32}
+PLY_COLUMNS  = {'game':np.int32, 'ply':np.int32, 'agent_id':np.int8, 'action_type':str, 'noble':np.bool_,
+                'score':np.int16, 'warning':np.bool_}
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+#Per-game record and per-ply columns of one replay file.
+def analyse_replay(path, game_name):
+    model = importlib.import_module(f"{game_name}.{game_name.lower()}_model")
+    GameRule = getattr(model, f'{game_name}GameRule')
+    with open(path, 'rb') as f:
+        replay = decodeReplay(pickle.load(f, encoding="bytes"), model)
+    replayer = HeadlessReplayer(GameRule, replay, interval=len(replay["actions"])+1)
+    warned = set(map(tuple, replay["warning_positions"]))
+    plies = {name:[] for name in PLY_COLUMNS}
+    first_noble = -1
+    for ply,state,action in replayer.states():
+        agent_id = replayer.actions[ply][0]
+        noble = bool(action.get('noble')) if isinstance(action, dict) else False
+        if noble and first_noble < 0:
+            first_noble = ply
+        for name,value in [('game', 0), ('ply', ply), ('agent_id', agent_id),
+                           ('action_type', action.get('type', '') if isinstance(action, dict) else str(action)),
+                           ('noble', noble), ('score', state.agents[agent_id].score),
+                           ('warning', (agent_id, ply) in warned)]:
+            plies[name].append(value)
+    agents = range(replay["num_of_agent"])
+    pad = lambda values : values[:MAX_AGENTS] + [-1]*(MAX_AGENTS-len(values))
+    game = {'replay':os.path.basename(path), 'seed':replay["seed"], 'num_agents':replay["num_of_agent"],
+            'plies':len(replayer), 'scores':pad([replay["scores"][i] for i in agents]),
+            'warnings':pad([sum(1 for a,_ in warned if a==i) for i in agents]),
+            'first_noble_ply':first_noble}
+    return game, plies
+
+def analyse_safely(args):
+    try:
+        return analyse_replay(*args)
+    except Exception:
+        print(f'Error: replay at "{args[0]}" could not be analysed!', file=sys.stderr)
+        traceback.print_exc()
+        return None
+
+#Replay files already in the tables at output_dir.
+def processed_files(output_dir):
+    done = set()
+    for part in glob.glob(os.path.join(output_dir, 'games-*.npz')):
+        with np.load(part) as columns:
+            done.update(columns['replay'].tolist())
+    return done
+
+def write_part(output_dir, part, results):
+    games = {name:[] for name in GAME_COLUMNS}
+    plies = {name:[] for name in PLY_COLUMNS}
+    for row,(game,columns) in enumerate(results):
+        for name in GAME_COLUMNS:
+            games[name].append(game[name])
+        columns['game'] = [row]*len(columns['ply'])
+        for name in PLY_COLUMNS:
+            plies[name].extend(columns[name])
+    #Ply tables are written before game tables, such that a run interrupted between the two redoes the part.
+    for table,columns,dtypes in [('plies', plies, PLY_COLUMNS), ('games', games, GAME_COLUMNS)]:
+        path = os.path.join(output_dir, f'{table}-{part:05d}.npz')
+        temp = os.path.join(output_dir, f'.{table}-{part:05d}.tmp.npz')
+        np.savez(temp, **{name:np.array(values, dtype=dtypes[name]) for name,values in columns.items()})
+        os.replace(temp, path)
+
+#Analyse every replay in replay_dir not yet in the tables at output_dir, over a pool of processes (one per core by
+#default). Results stream to disk as numbered part files of BATCH_SIZE replays: games-NNNNN.npz and plies-NNNNN.npz,
+#each holding one array per column. Returns the number of replays analysed.
+def analyse_directory(replay_dir, output_dir, game_name='Splendor', processes=None, pattern='replay-*.replay'):
+    os.makedirs(output_dir, exist_ok=True)
+    done  = processed_files(output_dir)
+    paths = sorted(p for p in glob.glob(os.path.join(replay_dir, pattern)) if os.path.basename(p) not in done)
+    parts = [int(os.path.basename(p)[6:11]) for p in glob.glob(os.path.join(output_dir, 'games-*.npz'))]
+    part  = max(parts, default=-1) + 1
+    analysed,batch = 0,[]
+    processes = processes or os.cpu_count()
+    chunksize = max(1, min(64, len(paths) // (4*processes)))
+    with ProcessPoolExecutor(processes) as pool:
+        for result in pool.map(analyse_safely, [(path, game_name) for path in paths], chunksize=chunksize):
+            if result is not None:
+                batch.append(result)
+            if len(batch) == BATCH_SIZE:
+                write_part(output_dir, part, batch)
+                part,analysed,batch = part+1,analysed+len(batch),[]
+    if batch:
+        write_part(output_dir, part, batch)
+        analysed += len(batch)
+    return analysed
+
+#All part files of a table ('games' or 'plies') concatenated, column by column. Ply rows' game column indexes rows of
+#the games table once parts are concatenated.
+def load_table(output_dir, table):
+    #Only complete parts, which have a games file, are read.
+    parts = sorted(os.path.join(output_dir, os.path.basename(p).replace('games-', f'{table}-'))
+                   for p in glob.glob(os.path.join(output_dir, 'games-*.npz')))
+    columns,offset = {},0
+    for part in parts:
+        with np.load(part) as data:
+            for name in data.files:
+                values = data[name]
+                if table == 'plies' and name == 'game':
+                    values = values + offset
+                columns.setdefault(name, []).append(values)
+        if table == 'plies':
+            with np.load(part.replace('plies-', 'games-')) as games:
+                offset += len(games['replay'])
+    return {name:np.concatenate(values) for name,values in columns.items()}
+
+def loadParameter():
+    parser = OptionParser(usage='python replay_analysis.py [options]')
+    parser.add_option('-g','--game', help='The name of the game, starting with a uppercase character (default: Splendor)', default="Splendor")
+    parser.add_option('-r','--replays', help='Directory of .replay files (default: output)', default='output')
+    parser.add_option('-o','--output', help='Directory for the columnar tables (default: output/analysis)', default='output/analysis')
+    parser.add_option('-j','--processes', type='int', help='Number of worker processes (default: one per core)', default=None)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    return options
+
+
+if __name__ == '__main__':
+    options = loadParameter()
+    analysed = analyse_directory(options.replays, options.output, options.game, options.processes)
+    print(f'Analysed {analysed} new replays into {options.output}.')
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
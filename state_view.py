@@ -0,0 +1,171 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Read-only views of game states and actions, handed to agents in place of deep copies.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import copy
+from types import MemberDescriptorType, GetSetDescriptorType
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+#Values returned as they are, rather than wrapped: immutable builtins, and any class that marks its instances as
+#immutable with IMMUTABLE = True (e.g. interned cards, frozen gem counts).
+SCALARS = (int, float, complex, str, bytes, bool, type(None), frozenset, range)
+
+#Methods of builtin containers that mutate them in place.
+MUTATORS = {
+    dict:  {'clear', 'pop', 'popitem', 'setdefault', 'update', '__ior__'},
+    list:  {'append', 'clear', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort', '__iadd__', '__imul__'},
+    set:   {'add', 'clear', 'difference_update', 'discard', 'intersection_update', 'pop', 'remove',
+            'symmetric_difference_update', 'update'},
+    tuple: set(),
+}
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+class ReadOnlyError(TypeError):
+    pass
+
+
+#A view over an object that reads through to it and raises ReadOnlyError on any write. Attributes, items and method
+#results are themselves wrapped, such that nested boards, agents, gem dicts and card lists can't be written through
+#either. Methods of the wrapped object's class run with the view as self, so a mutating method raises as well, and
+#their results (like properties') are wrapped in turn.
+#isinstance() sees the wrapped class. A view is live: it follows the object it wraps. To keep, or to modify, a state,
+#copy it with copy.deepcopy (or copy.copy), which gives an ordinary independent object, so that agents pay for a
+#clone only when they actually want to write.
+class ReadOnlyView(object):
+    __slots__ = ('_view_target',)
+
+    def __init__(self, target):
+        object.__setattr__(self, '_view_target', target)
+
+    @property
+    def __class__(self):
+        return type(self._view_target)
+
+    def __getattr__(self, name):
+        target = self._view_target
+        cls = type(target)
+        if cls in MUTATORS:
+            if name in MUTATORS[cls]:
+                raise ReadOnlyError(f"{cls.__name__}.{name}() on a read-only view")
+            if name in ('items', 'values'):
+                return lambda : [(k, view(v)) for k,v in target.items()] if name=='items' else \
+                                [view(v) for v in target.values()]
+            if name=='copy':
+                return lambda : copy.deepcopy(target)
+            method = getattr(target, name)
+            return lambda *args, **kwargs : view(method(*args, **kwargs))
+        if name in getattr(target, '__dict__', ()):
+            return view(target.__dict__[name])
+        for klass in cls.__mro__:
+            if name in klass.__dict__:
+                attr = klass.__dict__[name]
+                if isinstance(attr, (MemberDescriptorType, GetSetDescriptorType)):
+                    return view(attr.__get__(target, cls))
+                if hasattr(attr, '__get__'):
+                    bound = attr.__get__(self, cls)
+                    if callable(bound) and not isinstance(attr, property):
+                        return lambda *args, **kwargs : view(bound(*args, **kwargs))
+                    return view(bound)
+                return view(attr)
+        return view(getattr(target, name))
+
+    def __setattr__(self, name, value):
+        raise ReadOnlyError(f"cannot set '{name}' on a read-only view")
+
+    def __delattr__(self, name):
+        raise ReadOnlyError(f"cannot delete '{name}' from a read-only view")
+
+    def __setitem__(self, key, value):
+        raise ReadOnlyError("cannot assign items of a read-only view")
+
+    def __delitem__(self, key):
+        raise ReadOnlyError("cannot delete items of a read-only view")
+
+    def __getitem__(self, key):
+        return view(self._view_target[key])
+
+    def __iter__(self):
+        return (view(item) for item in self._view_target)
+
+    def __reversed__(self):
+        return (view(item) for item in reversed(self._view_target))
+
+    def __len__(self):
+        return len(self._view_target)
+
+    def __bool__(self):
+        return bool(self._view_target)
+
+    def __contains__(self, item):
+        return unwrap(item) in self._view_target
+
+    def __hash__(self):
+        return hash(self._view_target)
+
+    def __eq__(self, other):
+        return self._view_target == unwrap(other)
+
+    def __ne__(self, other):
+        return self._view_target != unwrap(other)
+
+    def __lt__(self, other):
+        return self._view_target < unwrap(other)
+
+    def __le__(self, other):
+        return self._view_target <= unwrap(other)
+
+    def __gt__(self, other):
+        return self._view_target > unwrap(other)
+
+    def __ge__(self, other):
+        return self._view_target >= unwrap(other)
+
+    def __add__(self, other):
+        return type(self._view_target)(self) + other
+
+    def __radd__(self, other):
+        return other + type(self._view_target)(self)
+
+    def __repr__(self):
+        return repr(self._view_target)
+
+    def __str__(self):
+        return str(self._view_target)
+
+    def __copy__(self):
+        return copy.deepcopy(self._view_target)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self._view_target, memo)
+
+    def __reduce_ex__(self, protocol):
+        return self._view_target.__reduce_ex__(protocol)
+
+
+# FUNCTIONS ----------------------------------------------------------------------------------------------------------#
+
+#Wrap a value in a ReadOnlyView, unless it's immutable already.
+def view(value):
+    if isinstance(value, SCALARS) or type(value) is ReadOnlyView or getattr(type(value), 'IMMUTABLE', False):
+        return value
+    return ReadOnlyView(value)
+
+#The object(s) behind a value possibly holding views, e.g. an action an agent built from parts of a view.
+def unwrap(value):
+    cls = type(value)
+    if cls is ReadOnlyView:
+        return object.__getattribute__(value, '_view_target')
+    if cls is dict:
+        return {k:unwrap(v) for k,v in value.items()}
+    if cls is list:
+        return [unwrap(v) for v in value]
+    if cls is tuple:
+        return tuple([unwrap(v) for v in value])
+    return value
+
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
@@ -1,5 +1,6 @@
 import utils
 import random
+import pickle
 
 
 class GameState:
@@ -12,9 +13,15 @@ class Action:
 
 
 class GameRule:
-    def __init__(self, num_of_agent = 2):
+    # Names of methods whose calls are counted when a Game is instrumented (see instrumentation.py).
+    instrumented_calls = ()
+
+    def __init__(self, num_of_agent = 2, rng = None):
         self.current_agent_index = 0
         self.num_of_agent = num_of_agent
+        # The game's source of randomness: a random.Random owned by the Game running it, or None for the global random
+        # module.
+        self.rng = rng
         self.current_game_state = self.initialGameState()
         self.action_counter = 0
 
@@ -33,6 +40,12 @@ class GameRule:
         utils.raiseNotDefined()
         return []
 
+    # Called by Game.Run with the read-only views of the game state and legal actions about to be handed to an agent,
+    # such that games may let agents reuse the list instead of regenerating it. Not called when agents are handed deep
+    # copies, which they may write to. Does nothing by default.
+    def shareLegalActions(self, game_state, agent_id, actions):
+        pass
+
     def calScore(self, game_state,agent_id):
         utils.raiseNotDefined()
         return 0
@@ -50,6 +63,16 @@ class GameRule:
     def getCurrentAgentIndex(self):
         return self.current_agent_index
 
+    # Snapshot of the game's position (the game state, the agent to move and the number of actions taken) as bytes,
+    # kept in replays such that recorded games can be sought without replaying them from the first move. Games may
+    # override the pair with a compact encoding.
+    def snapshotState(self):
+        return pickle.dumps((self.current_game_state, self.current_agent_index, self.action_counter))
+
+    def restoreState(self, data):
+        self.current_game_state, self.current_agent_index, self.action_counter = pickle.loads(data)
+        return self
+
 class Agent(object):
     def __init__(self, _id):
         self.id = _id
@@ -61,6 +84,19 @@ class Agent(object):
     def SelectAction(self, actions, game_state):
         return random.choice(actions)
 
+    # Optional pondering, used only by games run with pondering enabled. While another agent chooses its move, the
+    # engine calls Ponder on a background thread with a copy of the game state of its own, and a threading.Event that
+    # is set once that move has been chosen. Ponder should return soon after stop is set: the move is applied once it
+    # has. The engine then calls ObserveAction with the ID of the agent that moved, its action and the resulting game
+    # state, such that work done while pondering (e.g. a search tree) can be reused. Neither counts against the agent's
+    # time limit. An agent that fails to return from Ponder in time observes no moves, and isn't asked to ponder again,
+    # until it has returned.
+    def Ponder(self, game_state, stop):
+        pass
+
+    def ObserveAction(self, agent_id, action, game_state):
+        pass
+
 
 class Displayer:
     def __init__(self):
@@ -0,0 +1,26 @@
+from game import Game
+from state_view import ReadOnlyView
+from agents.generic.first_move import myAgent
+from Splendor.splendor_model import LEGAL_ACTION_CACHE, SplendorGameRule
+
+
+#Start the first turn of a game, and return the cached legal actions of the agent to move, if any.
+def shared_actions(copy_states):
+    LEGAL_ACTION_CACHE.clear()
+    game = Game(SplendorGameRule, [myAgent(0), myAgent(1)], 2, seed=1, copy_states=copy_states)
+    agent_index,_,game_state,_,_,actions_copy,_ = game._StartTurn(0)
+    return LEGAL_ACTION_CACHE.get((game_state.zobrist, agent_index)), actions_copy
+
+
+def test_views_are_shared():
+    cached,actions_copy = shared_actions(copy_states=False)
+    assert cached is actions_copy
+    assert all(isinstance(action, ReadOnlyView) for action in cached)
+
+
+def test_mutable_copies_are_not_shared():
+    cached,actions_copy = shared_actions(copy_states=True)
+    assert cached is None
+    actions_copy[0]['type'] = 'x'
+    rule = SplendorGameRule(2, action_cache=True)
+    assert all(action['type'] != 'x' for action in rule.getLegalActions(rule.current_game_state, 0))
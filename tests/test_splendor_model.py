@@ -0,0 +1,39 @@
+import copy
+import pytest
+from Splendor.splendor_model import SplendorGameRule, RETURN_COMBOS
+
+RULE_OPTIONS = [{}, {'action_cache':True}, {'incremental':True}]
+
+
+#A position in which every collect action needs gems returned.
+def full_hand(rule):
+    state = rule.current_game_state
+    state.agents[0].gems.update({'red':3, 'green':3, 'blue':3})
+    for colour in ('red', 'green', 'blue'):
+        state.board.gems[colour] -= 3
+    return state
+
+
+@pytest.mark.parametrize('options', RULE_OPTIONS)
+def test_mutating_returned_gems_leaves_legal_actions_unchanged(options):
+    rule = SplendorGameRule(2, **options)
+    state = full_hand(rule)
+    before = copy.deepcopy(rule.getLegalActions(state, 0))
+    table = copy.deepcopy(RETURN_COMBOS)
+    for action in rule.getLegalActions(state, 0):
+        with pytest.raises(TypeError):
+            action['returned_gems']['yellow'] = 5
+        with pytest.raises(TypeError):
+            action['returned_gems'].clear()
+    assert rule.getLegalActions(state, 0) == before
+    assert SplendorGameRule(2, **options).getLegalActions(state, 0) == before
+    assert RETURN_COMBOS == table
+
+
+def test_copied_actions_are_mutable():
+    rule = SplendorGameRule(2)
+    state = full_hand(rule)
+    actions = rule.getLegalActions(state, 0)
+    own = copy.deepcopy(actions[0])
+    own['returned_gems']['yellow'] = 5
+    assert 'yellow' not in actions[0]['returned_gems']
@@ -0,0 +1,36 @@
+import copy
+import pytest
+from state_view import ReadOnlyError, view
+from Splendor.splendor_model import SplendorGameRule
+
+
+#A state two moves in, such that both agents' traces hold the engine's own actions.
+def played_state():
+    rule = SplendorGameRule(2)
+    for _ in range(2):
+        rule.update(rule.getLegalActions(rule.current_game_state, rule.current_agent_index)[0])
+    return rule.current_game_state
+
+
+def test_trace_entries_are_read_only():
+    state = played_state()
+    recorded = copy.deepcopy(state.agents[0].agent_trace.action_reward)
+    gs = view(state)
+    with pytest.raises(ReadOnlyError):
+        gs.agents[0].agent_trace.action_reward[0][0]['type'] = 'x'
+    with pytest.raises(ReadOnlyError):
+        gs.agents[0].agent_trace.history.entry[0]['collected_gems'].clear()
+    with pytest.raises(ReadOnlyError):
+        gs.agents[0].agent_trace.history.entries()[0][0]['noble'] = None
+    assert state.agents[0].agent_trace.action_reward == recorded
+
+
+def test_method_results_are_read_only():
+    state = played_state()
+    gs = view(state)
+    with pytest.raises(ReadOnlyError):
+        gs.board.dealt_list().append(None)
+    with pytest.raises(ReadOnlyError):
+        gs.agents[0].agent_trace.append(('x', 0))
+    assert gs.to_bytes() == state.to_bytes()
+